@@ -3,7 +3,10 @@
 # Desc: network module config
 
 from .web.views.public import status
-from .web.views.dashboard import dashboard
+from .web.views.onboard import api_bulk_add_devices
+from .web.views.dashboard import (
+    dashboard, api_get_leaderboards, api_get_stats_cache
+)
 
 # Basics
 TITLE = 'Network'
@@ -13,7 +16,10 @@ COLOR = 'purple'
 # Module routes
 ROUTES = (
     ('', ['GET'], dashboard),
-    ('/status', ['GET'], status)
+    ('/status', ['GET'], status),
+    ('/leaderboards', ['GET'], api_get_leaderboards),
+    ('/stats_cache', ['GET'], api_get_stats_cache),
+    ('/devices/bulk', ['POST'], api_bulk_add_devices)
 )
 
 # Module settings (configurable in database)
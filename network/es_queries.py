@@ -1,16 +1,31 @@
 {
-    # Filter the device/stat_type
+    # Filter the device/stat_type (one flat document per device/type/key/tick)
     'query': {
         'bool': {
-            'must': [
+            'filter': [
                 {
-                    'match': {
-                        'device_id': 1
+                    'term': {
+                        'object_module': 'network'
                     }
                 },
                 {
-                    'match': {
-                        'stat_type': 'network_io'
+                    'term': {
+                        'object_type': 'device'
+                    }
+                },
+                {
+                    'term': {
+                        'object_id': 1
+                    }
+                },
+                {
+                    'term': {
+                        'type': 'network_io'
+                    }
+                },
+                {
+                    'term': {
+                        'key': 'eth0'
                     }
                 }
             ]
@@ -24,29 +39,14 @@
                 'interval': 'minute'
             },
             'aggregations': {
-                'stats': {
-                    'nested': {
-                        'path': 'stats'
-                    },
-                    'aggregations': {
-                        'eth1_filter': {
-                            'filter': {
-                                'term': {
-                                    'stats.stat_key': 'eth0'
-                                }
-                            },
-                            'aggregations': {
-                                'total_transmit_bytes': {
-                                    'sum': {
-                                        'field': 'stats.transmit_bytes'
-                                    }
-                                }
-                            }
-                        }
+                # Details are plain columns, no nested aggregation required
+                'total_transmit_bytes': {
+                    'sum': {
+                        'field': 'transmit_bytes'
                     }
                 }
             }
         }
     },
-    'size': 1
+    'size': 0
 }
@@ -0,0 +1,122 @@
+# oxy.io Network
+# File: network/leaderboard.py
+# Desc: fleet top-N leaderboards kept in Redis sorted sets by the monitors
+
+from __future__ import division
+
+from oxyio.app import task_app
+
+
+# Interfaces excluded from the network leaderboard
+IGNORE_INTERFACES = ('lo',)
+
+DEFAULT_COUNT = 10
+MAX_COUNT = 100
+
+
+def _get_cpu_score(stats, interval):
+    # The calculated CPU percentages exclude idle, so busy % is their sum
+    cpu = stats.get('cpu', {}).get('cpu')
+
+    if cpu:
+        return sum(cpu.itervalues())
+
+
+def _get_memory_score(stats, interval):
+    memory = stats.get('memory', {}).get('memory')
+
+    if memory and memory.get('total'):
+        free = sum(memory.get(key, 0) for key in ('free', 'buffers', 'cached'))
+        return (memory['total'] - free) / memory['total'] * 100
+
+
+def _get_disk_score(stats, interval):
+    # The fullest mount
+    percentages = [
+        disk['used'] / disk['blocks'] * 100
+        for disk in stats.get('disk', {}).itervalues()
+        if disk.get('blocks')
+    ]
+
+    if percentages:
+        return max(percentages)
+
+
+def _get_network_score(stats, interval):
+    # Bytes/second in & out over all interfaces
+    interfaces = stats.get('network_io')
+
+    if interfaces:
+        return sum(
+            details['receive_bytes'] + details['transmit_bytes']
+            for key, details in interfaces.iteritems()
+            if key not in IGNORE_INTERFACES
+        ) / interval
+
+
+# (metric, title, unit, score function)
+LEADERBOARD_METRICS = (
+    ('cpu', 'Busiest CPUs', '%', _get_cpu_score),
+    ('memory', 'Most memory used', '%', _get_memory_score),
+    ('disk', 'Fullest disks', '%', _get_disk_score),
+    ('network', 'Top talkers', 'B/s', _get_network_score)
+)
+
+
+def get_leaderboard_key(metric):
+    return 'network-leaderboard-{0}'.format(metric)
+
+
+def update_leaderboards(device_id, stats, interval):
+    '''
+    Set a devices scores from one ticks {type: {key: {detail: value}}} stats (total
+    stats being the change over interval seconds), in a single Redis round trip.
+    '''
+
+    pipe = task_app.redis.pipeline()
+
+    for metric, _, _, get_score in LEADERBOARD_METRICS:
+        score = get_score(stats, interval)
+
+        # Raw ZADD, as the redis clients disagree on zadds argument order
+        if score is not None:
+            pipe.execute_command('ZADD', get_leaderboard_key(metric), score, device_id)
+
+    pipe.execute()
+
+
+def remove_from_leaderboards(device_id):
+    pipe = task_app.redis.pipeline()
+
+    for metric, _, _, _ in LEADERBOARD_METRICS:
+        pipe.zrem(get_leaderboard_key(metric), device_id)
+
+    pipe.execute()
+
+
+def get_leaderboard_count(count=None):
+    '''Clamp a requested leaderboard length to [1, MAX_COUNT].'''
+
+    return max(1, min(count or DEFAULT_COUNT, MAX_COUNT))
+
+
+def get_leaderboards(count=None):
+    '''
+    Get the top count devices for every metric as
+    ``{metric: [(device_id, score), ...]}``, highest first.
+    '''
+
+    count = get_leaderboard_count(count)
+
+    pipe = task_app.redis.pipeline()
+
+    for metric, _, _, _ in LEADERBOARD_METRICS:
+        pipe.zrevrange(get_leaderboard_key(metric), 0, count - 1, withscores=True)
+
+    return {
+        metric: [
+            (int(device_id), round(score, 2))
+            for device_id, score in leaderboard
+        ]
+        for (metric, _, _, _), leaderboard in zip(LEADERBOARD_METRICS, pipe.execute())
+    }
@@ -2,14 +2,16 @@
 # File: network/models/device.py
 # Desc: the device & device_group models
 
-from socket import error as socket_error, gaierror
+import json
+from hashlib import sha1
+from pipes import quote
+from socket import error as socket_error, gaierror, timeout as socket_timeout
+from tempfile import SpooledTemporaryFile
+from time import time
 
 from flask import g
-from paramiko import (
-    SSHClient, RSAKey, MissingHostKeyPolicy, SSHException, AuthenticationException
-)
+from paramiko import SSHException, AuthenticationException
 
-from oxyio import settings
 from oxyio.app import db, task_app
 from oxyio.log import logger
 from oxyio.util import server_only, worker_only
@@ -21,8 +23,15 @@ from oxyio.web.flashes import flash_request, flash_task_subscribe
 from oxyio.web.request import get_request_data
 from oxyio.web.websockets import make_websocket_request
 
-from ..web.views.device import api_get_device_stats, api_get_device_stat_keys
-from ..web.views.group import api_get_group_stats
+from ..ssh import ssh_pool, ConnectBackoff
+from ..tasks.util.collect import FRAME_PREFIX
+from ..web.views.device import (
+    api_get_device_stats, api_get_device_stat_keys, api_export_device_stats,
+    api_execute_device
+)
+from ..web.views.group import (
+    api_get_group_stats, api_export_group_stats, api_execute_group
+)
 
 
 # Many-many linking table (device <-> device group)
@@ -49,6 +58,8 @@ class DeviceGroup(Object, db.Model):
 
     ROUTES = (
         ('stats', ['GET'], api_get_group_stats, 'view'),
+        ('export', ['GET'], api_export_group_stats, 'view'),
+        ('execute', ['POST'], api_execute_group, 'edit')
     )
 
     devices = db.relationship('Device', secondary=device__group)
@@ -62,12 +73,27 @@ class DeviceFact(Item, db.Model):
     NAME = 'network/device/fact'
     TITLE = 'Fact'
 
+    # One row per fact group (see tasks/util/facts.py) per device
+    __table_args__ = (
+        db.UniqueConstraint('device_id', 'key', name='device_id_key'),
+    )
+
     device_id = db.Column(
         db.Integer, db.ForeignKey('network_device.id', ondelete='CASCADE'),
         nullable=False
     )
     device = db.relationship('Device', backref=db.backref('facts'))
 
+    key = db.Column(db.String(64), nullable=False)
+
+    # JSON encoded facts & their SHA1, so unchanged facts aren't rewritten
+    value = db.Column(db.Text)
+    hash = db.Column(db.String(40))
+
+    @property
+    def data(self):
+        return json.loads(self.value) if self.value else None
+
 
 class Device(Object, db.Model):
     # Config
@@ -99,10 +125,26 @@ class Device(Object, db.Model):
 
     ROUTES = (
         ('stats', ['GET'], api_get_device_stats, 'view'),
-        ('stats_keys', ['GET'], api_get_device_stat_keys, 'view')
+        ('stats_keys', ['GET'], api_get_device_stat_keys, 'view'),
+        ('export', ['GET'], api_export_device_stats, 'view'),
+        ('execute', ['POST'], api_execute_device, 'edit')
     )
 
+    # Devices are monitored by one of MONITOR_SHARDS network/monitor_scheduler tasks,
+    # the per-device task ID is kept as the channel monitor events are published to.
     MONITOR_TASK_PREFIX = 'monitor-device-'
+    MONITOR_SHARD_PREFIX = 'monitor-shard-'
+    MONITOR_SHARDS = 16
+
+    # Channel the devices monitor publishes top processes to while subscribed
+    PROCESSES_TASK_PREFIX = 'processes-device-'
+
+    # While a device is being viewed its monitor samples (for the websocket stream
+    # only) every LIVE_STATS_INTERVAL seconds, for up to LIVE_STATS_DURATION.
+    LIVE_STATS_INTERVAL = 1
+    LIVE_STATS_DURATION = 300
+
+    STAT_MODES = ('Batch', 'Parallel', 'Agent')
 
     # DB Columns
     #
@@ -121,6 +163,14 @@ class Device(Object, db.Model):
         nullable=False, default=10, server_default='10'
     )
 
+    # How the monitor collects stats: one framed command per tick, one command per
+    # stat type in parallel (more channels, but no reliance on the remote shell) or
+    # a long running agent streaming samples over a single channel.
+    stat_mode = db.Column(
+        db.Enum(*STAT_MODES),
+        default='Batch', server_default='Batch', nullable=False
+    )
+
     # Device groups
     groups = db.relationship('DeviceGroup', secondary=device__group)
 
@@ -135,6 +185,16 @@ class Device(Object, db.Model):
     # NULL = untested
     ssh_connected = db.Column(db.Boolean)
 
+    # Bytes read from command channels at a time
+    EXECUTE_READ_SIZE = 32768
+
+    # Seconds to wait on stdout before draining stderr again
+    EXECUTE_POLL_INTERVAL = 0.5
+
+    # Bytes written per SFTP request, and kept in memory when spooling puts
+    PUT_CHUNK_SIZE = 32768
+    PUT_SPOOL_SIZE = 8 * 1024 * 1024
+
     # SSH internals
     _connecting = False
     _connected = False
@@ -148,6 +208,18 @@ class Device(Object, db.Model):
     def stats_api_url(self):
         return '{0}/stats'.format(self.view_url)
 
+    # Facts
+    #
+
+    @property
+    def fact_data(self):
+        '''Get the devices stored facts as {key: facts}.'''
+
+        return {
+            fact.key: fact.data
+            for fact in self.facts
+        }
+
     # Exceptions
     #
 
@@ -163,6 +235,12 @@ class Device(Object, db.Model):
     class CommandError(DeviceError):
         pass
 
+    class CommandTimeoutError(CommandError):
+        pass
+
+    class CommandOutputError(CommandError):
+        pass
+
     class FileError(DeviceError):
         pass
 
@@ -182,34 +260,60 @@ class Device(Object, db.Model):
             )
             flash_request('device_monitor', request_key)
 
-            # Create websocket request for the processes tab
+            # Ask the monitor for high frequency samples while we're watching
+            self.request_live_stats()
+
+            # Brings up the shard (& so every other shard) if it's not running
+            self.ensure_monitor_shard()
+
+            # Create websocket request for the processes tab, the monitor samples
+            # processes only while this is subscribed.
+            request_key = make_websocket_request(
+                'core/task_subscribe', self.processes_task_id
+            )
+            flash_request('device_processes', request_key)
 
     @server_only
     def check_apply_edit(self, request_data):
+        # HTML is a checkbox, so lack of presence = off, the API expects a JSON bool
+        if not g.api:
+            request_data['ssh_sudo'] = request_data.get('ssh_sudo') == 'on'
+
+        self.apply_edit(request_data)
+
+    @server_only
+    def apply_edit(self, request_data):
+        '''
+        Validate & apply device fields (as the API sends them), shared by the add/edit
+        views & bulk onboarding.
+        '''
+
         # Validate int input
         for field in ('stat_interval', 'ssh_port'):
             if field in request_data:
                 try:
                     request_data[field] = int(request_data[field])
-                except ValueError:
+                except (TypeError, ValueError):
                     raise self.EditRequestError('Invalid {0}'.format(field))
 
-        # Validate sudo, API expects JSON bool
-        if g.api:
-            if (
-                'ssh_sudo' in request_data
-                and not isinstance(request_data['ssh_sudo'], bool)
-            ):
-                raise self.EditRequestError('Invalid ssh_sudo (not boolean)')
+        # Validate sudo
+        if (
+            'ssh_sudo' in request_data
+            and not isinstance(request_data['ssh_sudo'], bool)
+        ):
+            raise self.EditRequestError('Invalid ssh_sudo (not boolean)')
 
-        # HTML is a checkbox, so lack of presence = off
-        else:
-            request_data['ssh_sudo'] = request_data.get('ssh_sudo') == 'on'
+        # Validate stat mode
+        if (
+            'stat_mode' in request_data
+            and request_data['stat_mode'] not in self.STAT_MODES
+        ):
+            raise self.EditRequestError('Invalid stat_mode')
 
         update = reconnect = False
 
         # Non SSH connection affecting data
-        for field in ('stat_interval', 'ssh_sudo'):
+        for field in ('stat_interval', 'stat_mode', 'ssh_sudo'):
             if field in request_data and request_data[field] != getattr(self, field):
                 setattr(self, field, request_data[field])
                 update = True
@@ -256,6 +360,10 @@ class Device(Object, db.Model):
 
     @server_only
     def post_edit(self):
+        # Groups may have changed, and the monitor tags stats with them
+        if self.status == 'Active' and self.ssh_connected:
+            self.reload_monitor()
+
         self.post_add_edit()
 
     @server_only
@@ -269,71 +377,284 @@ class Device(Object, db.Model):
     def monitor_task_id(self):
         return '{0}{1}'.format(self.MONITOR_TASK_PREFIX, self.id)
 
+    @property
+    def processes_task_id(self):
+        return '{0}{1}'.format(self.PROCESSES_TASK_PREFIX, self.id)
+
+    @property
+    def monitor_shard(self):
+        return self.id % self.MONITOR_SHARDS
+
+    @property
+    def monitor_shard_task_id(self):
+        return self.get_monitor_shard_task_id(self.monitor_shard)
+
+    @classmethod
+    def get_monitor_shard_task_id(cls, shard):
+        return '{0}{1}'.format(cls.MONITOR_SHARD_PREFIX, shard)
+
+    @classmethod
+    def get_monitor_reload_key(cls, shard):
+        '''Get the Redis set of device IDs a shard should (re)load from the DB.'''
+
+        return 'network-{0}{1}-reload'.format(cls.MONITOR_SHARD_PREFIX, shard)
+
+    # Shards monitor their Active, connected devices as found in the DB, these just
+    # make the shard pick up changes now rather than on its next sync.
+
     def start_monitor(self):
-        task_app.helpers.start_task(
-            'network/device_monitor',
-            task_id=self.monitor_task_id,
-            cleanup=False,
-            device_id=self.id
-        )
+        self.reload_monitor()
+        self.ensure_monitor_shard()
 
     def stop_monitor(self):
-        task_app.helpers.stop_task(self.monitor_task_id)
+        self.reload_monitor()
 
     def reload_monitor(self):
-        task_app.helpers.reload_task(self.monitor_task_id)
+        task_app.redis.sadd(self.get_monitor_reload_key(self.monitor_shard), self.id)
 
     def ensure_monitor(self):
-        task = task_app.helpers.get_task(self.monitor_task_id)
+        self.start_monitor()
+
+    @property
+    def live_stats_key(self):
+        return 'network-live-stats-{0}'.format(self.id)
+
+    def request_live_stats(self, interval=None, duration=None):
+        '''
+        Lease high frequency sampling from the running monitor, which drops back to
+        stat_interval once the lease (a Redis key) expires.
+        '''
+
+        task_app.redis.set(
+            self.live_stats_key,
+            interval or self.LIVE_STATS_INTERVAL,
+            ex=duration or self.LIVE_STATS_DURATION
+        )
+
+    def ensure_monitor_shard(self):
+        self.ensure_monitor_shard_task(self.monitor_shard)
+
+    @classmethod
+    def ensure_monitor_shard_task(cls, shard):
+        task_id = cls.get_monitor_shard_task_id(shard)
+        task = task_app.helpers.get_task(task_id)
 
         if not task:
-            self.start_monitor()
+            task_app.helpers.start_task(
+                'network/monitor_scheduler',
+                task_id=task_id,
+                cleanup=False,
+                shard=shard
+            )
             return
 
         # If not running, restart by requeueing - this won't requeue if the task is
         # already present in the new queue.
         if task.get('state') != 'RUNNING':
-            task_app.helpers.restart_task(self.monitor_task_id)
+            task_app.helpers.restart_task(task_id)
+
+    @classmethod
+    def ensure_monitor_shards(cls):
+        for shard in xrange(cls.MONITOR_SHARDS):
+            cls.ensure_monitor_shard_task(shard)
 
     # SSH
     #
 
     @worker_only
-    def connect(self, password=None):
-        '''Connect this device to it's bound SSH host.'''
+    def connect(self, password=None, backoff=True):
+        '''
+        Connect this device to it's bound SSH host, sharing any healthy pooled
+        connection in this process. Set backoff False to ignore the pools reconnect
+        backoff, ie when a user is waiting on the connect.
+        '''
 
         logger.debug('Connecting to device #{}: {}'.format(self.id, self.ssh_host))
 
-        kwargs = {
-            'username': self.ssh_user,
-            'port': self.ssh_port,
-            'timeout': settings.SSH_TIMEOUT
-        }
-
-        if password:
-            kwargs['password'] = password
-        else:
-            kwargs['pkey'] = RSAKey.from_private_key_file(
-                filename=settings.SSH_KEY_PRIVATE,
-                password=settings.SSH_KEY_PASSWORD
-            )
-
-        client = SSHClient()
-        client.set_missing_host_key_policy(MissingHostKeyPolicy())
-
         try:
-            client.connect(self.ssh_host, **kwargs)
+            client = ssh_pool.get(
+                self.ssh_host, self.ssh_port, self.ssh_user,
+                password=password, backoff=backoff
+            )
         except (
-            SSHException, AuthenticationException, socket_error, gaierror
+            SSHException, AuthenticationException, ConnectBackoff,
+            socket_error, gaierror
         ) as e:
+            self._connected = False
             raise self.ConnectionError(str(e))
 
+        # Pool handed us a new connection, any SFTP session is stale
+        if client is not self._connection:
+            self._sftp = None
+
         self._connection = client
         self._connected = True
 
     @worker_only
-    def put(self, data, destination):
-        '''Copy data to the remote device's filesystem.'''
+    def disconnect(self):
+        '''Drop this devices (pooled) connection, ie after it has failed.'''
+
+        ssh_pool.discard(self.ssh_host, self.ssh_port, self.ssh_user)
+
+        self._connection = self._sftp = None
+        self._connected = False
+
+    def _disconnect_if_dead(self):
+        # Only drop the pooled connection if it has failed, rather than just this
+        # channel (ie MaxSessions), as other devices/tasks on the host share it.
+        transport = self._connection.get_transport() if self._connection else None
+
+        if not transport or not transport.is_active():
+            self.disconnect()
+
+    def _open_channel(self, command):
+        transport = self._connection.get_transport()
+
+        try:
+            if not transport:
+                raise SSHException('SSH session not active')
+
+            channel = transport.open_session()
+            channel.exec_command(command)
+
+        except (SSHException, socket_error) as e:
+            self._disconnect_if_dead()
+            raise self.ConnectionError(str(e))
+
+        return channel
+
+    def _iter_output(self, channel, stderr, timeout=None, max_output=None):
+        '''
+        Yields stdout chunks from a channel as they arrive, collecting stderr into the
+        passed list. Raises CommandTimeoutError/CommandOutputError when the command
+        runs past timeout seconds or outputs more than max_output bytes (of stdout &
+        stderr combined).
+        '''
+
+        deadline = time() + timeout if timeout else None
+        size = 0
+        finished = False
+
+        while True:
+            # Keep stderr moving so it can't fill the channel window, including while
+            # the command writes nothing to stdout.
+            while channel.recv_stderr_ready():
+                error_data = channel.recv_stderr(self.EXECUTE_READ_SIZE)
+                size += len(error_data)
+                stderr.append(error_data)
+
+                if max_output and size > max_output:
+                    raise self.CommandOutputError(
+                        'Output exceeded {0} bytes'.format(max_output)
+                    )
+
+            # Stdout is closed & stderr drained after it
+            if finished:
+                break
+
+            wait = self.EXECUTE_POLL_INTERVAL
+
+            if deadline:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    raise self.CommandTimeoutError('Timed out after {0}s'.format(timeout))
+
+                wait = min(wait, remaining)
+
+            channel.settimeout(wait)
+
+            try:
+                data = channel.recv(self.EXECUTE_READ_SIZE)
+            except socket_timeout:
+                continue
+
+            if not data:
+                finished = True
+                continue
+
+            size += len(data)
+            if max_output and size > max_output:
+                raise self.CommandOutputError(
+                    'Output exceeded {0} bytes'.format(max_output)
+                )
+
+            yield data
+
+    def _iter_lines(self, chunks):
+        buffer = ''
+
+        for chunk in chunks:
+            lines = (buffer + chunk).split('\n')
+            buffer = lines.pop()
+
+            for line in lines:
+                yield '{0}\n'.format(line)
+
+        if buffer:
+            yield buffer
+
+    def _get_put_source(self, data):
+        '''
+        Get (data, size, sha1) for a put, where data is the original string/seekable
+        file or, for iterators & unseekable files, a spooled copy.
+        '''
+
+        if isinstance(data, basestring):
+            return data, len(data), sha1(data).hexdigest()
+
+        if hasattr(data, 'read'):
+            chunks = iter(lambda: data.read(self.PUT_CHUNK_SIZE), '')
+
+            try:
+                start = data.tell()
+            except (AttributeError, IOError):
+                start = None
+        else:
+            chunks = iter(data)
+            start = None
+
+        source = data if start is not None else SpooledTemporaryFile(
+            max_size=self.PUT_SPOOL_SIZE
+        )
+
+        hasher = sha1()
+        size = 0
+
+        for chunk in chunks:
+            hasher.update(chunk)
+            size += len(chunk)
+
+            if source is not data:
+                source.write(chunk)
+
+        source.seek(start or 0)
+        return source, size, hasher.hexdigest()
+
+    def _is_remote_unchanged(self, destination, size, sha1_hash):
+        try:
+            stat = self._sftp.stat(destination)
+        except IOError:
+            return False
+
+        # Only checksum the remote file if the size matches
+        if stat.st_size != size:
+            return False
+
+        try:
+            output = self.execute('sha1sum {0}'.format(quote(destination)), raw=True)
+        except self.CommandError:
+            return False
+
+        return output.split(None, 1)[:1] == [sha1_hash]
+
+    @worker_only
+    def put(self, data, destination, skip_unchanged=True):
+        '''
+        Copy data (a string, file-like object or iterator of strings) to the remote
+        device's filesystem, in pipelined PUT_CHUNK_SIZE writes. Unless
+        skip_unchanged is False, the upload is skipped if the remote file has the same
+        size & SHA1. Returns whether the file was uploaded.
+        '''
 
         if not self._connected:
             raise self.NotConnected()
@@ -341,19 +662,51 @@ class Device(Object, db.Model):
         if not self._sftp:
             # Naughty use of private method here, but Paramiko only does filename uploads
             # see: http://stackoverflow.com/questions/5914761
-            self._sftp = self._connection._make_sftp()
+            try:
+                self._sftp = self._connection._make_sftp()
 
-        f = self._sftp.open(destination, 'wb')
-        f.write(data)
-        f.close()
+            # ie the SFTP subsystem is disabled
+            except SSHException as e:
+                raise self.FileError('Could not start SFTP: {0}'.format(e))
 
-    @worker_only
-    def execute(self, command, sudo=False):
-        '''Execute a command on the remote device.'''
+        source, size, sha1_hash = self._get_put_source(data)
 
-        if not self._connected:
-            raise self.NotConnected()
+        try:
+            if skip_unchanged and self._is_remote_unchanged(destination, size, sha1_hash):
+                logger.debug('Skipping unchanged upload to device #{0}: {1}'.format(
+                    self.id, destination
+                ))
+                return False
+
+            if isinstance(source, basestring):
+                chunks = (
+                    source[i:i + self.PUT_CHUNK_SIZE]
+                    for i in xrange(0, size, self.PUT_CHUNK_SIZE)
+                )
+            else:
+                chunks = iter(lambda: source.read(self.PUT_CHUNK_SIZE), '')
+
+            f = self._sftp.open(destination, 'wb')
+
+            # Don't wait for each write to be acknowledged, errors come out on close
+            f.set_pipelined(True)
+
+            try:
+                for chunk in chunks:
+                    f.write(chunk)
+            finally:
+                f.close()
+
+        except (IOError, SSHException) as e:
+            raise self.FileError(str(e))
+
+        finally:
+            if source is not data:
+                source.close()
+
+        return True
 
+    def _make_command(self, command, sudo=False):
         # If sudo, wrap w/sudo & bash
         if sudo:
             command = 'sudo -S bash -c "{}"'.format(command)
@@ -362,27 +715,196 @@ class Device(Object, db.Model):
             command = 'bash -c "{}"'.format(command)
 
         logger.debug('Executing command on device #{}: {}'.format(self.id, command))
+        return command
 
-        # Run the command, get stdout, stderr & the channel
-        _, stdout, stderr = self._connection.exec_command(command)
-        channel = stdout.channel
+    @worker_only
+    def execute(
+        self, command, sudo=False, raw=False, callback=None,
+        timeout=None, max_output=None
+    ):
+        '''
+        Execute a command on the remote device. Returns stdout as a list of lines, or
+        when raw the whole output as one string. If a callback is passed each line is
+        handed to it as it arrives instead. Commands exceeding timeout (seconds) or
+        max_output (bytes) are closed early.
+        '''
+
+        if not self._connected:
+            raise self.NotConnected()
+
+        channel = self._open_channel(self._make_command(command, sudo=sudo))
+        stdout = [] if not raw else ''
+        stderr = []
+
+        try:
+            chunks = self._iter_output(
+                channel, stderr,
+                timeout=timeout, max_output=max_output
+            )
+
+            if callback:
+                for line in self._iter_lines(chunks):
+                    callback(line)
+            else:
+                stdout = ''.join(chunks)
+                if not raw:
+                    stdout = stdout.splitlines(True)
+
+            exit_status = channel.recv_exit_status()
+
+        finally:
+            channel.close()
 
-        # We have to iterate to get an exit_status
-        # so we return stdout/stderr as lists of each line of output
-        stdout = [line for line in stdout]
-        stderr = [line for line in stderr]
+        stderr = ''.join(stderr)
+        if not raw:
+            stderr = stderr.splitlines(True)
 
         # Return depending on the exit code
         # when the server provides no exit status, paramiko will return -1
         # here we assume this is correct, and return stdout as normal
-        if channel.exit_status <= 0:
+        if exit_status <= 0:
             return stdout
         else:
             # The number of programs which don't use stderr is quite insane
-            raise self.CommandError(channel.exit_status, stderr, stdout)
+            raise self.CommandError(exit_status, stderr, stdout)
+
+    @worker_only
+    def execute_stream(
+        self, command, sudo=False, raw=False,
+        timeout=None, max_output=None
+    ):
+        '''
+        Execute a (long running) command on the remote device, yielding each line of
+        stdout (or raw chunk) as it arrives. The channel is closed when the generator
+        is, or when timeout/max_output are exceeded.
+        '''
+
+        if not self._connected:
+            raise self.NotConnected()
+
+        channel = self._open_channel(self._make_command(command, sudo=sudo))
+        stderr = []
+
+        try:
+            chunks = self._iter_output(
+                channel, stderr,
+                timeout=timeout, max_output=max_output
+            )
+
+            for data in (chunks if raw else self._iter_lines(chunks)):
+                yield data
+
+            exit_status = channel.recv_exit_status()
+            if exit_status > 0:
+                raise self.CommandError(
+                    exit_status, ''.join(stderr).splitlines(True), []
+                )
+
+        finally:
+            channel.close()
+
+    def _make_multi_script(self, commands):
+        # Each command runs in a subshell (as if run alone) with no stdin, which is
+        # the script itself. Output is framed so it can be split per command, and
+        # the script stops at the first failing command.
+        lines = []
+
+        for i, command in enumerate(commands):
+            lines.extend((
+                "printf '\\n{0}{1}\\n'; printf '\\n{0}{1}\\n' >&2".format(FRAME_PREFIX, i),
+                '(',
+                command,
+                ') < /dev/null',
+                '__status=$?',
+                "printf '\\n{0}exit:%s\\n' $__status".format(FRAME_PREFIX),
+                '[ $__status -eq 0 ] || exit 0'
+            ))
+
+        return '{0}\n'.format('\n'.join(lines))
+
+    def _split_multi_output(self, output):
+        # Splits framed output into {index: output}, plus any {index: exit status}
+        outputs = {}
+        exit_statuses = {}
+        index = None
+
+        for frame in output.split('\n{0}'.format(FRAME_PREFIX))[1:]:
+            header, _, data = frame.partition('\n')
+
+            if header.startswith('exit:'):
+                exit_statuses[index] = int(header[5:])
+            else:
+                index = int(header)
+                outputs[index] = data
+
+        return outputs, exit_statuses
 
     @worker_only
-    def execute_multi(self, *commands):
-        '''Multi-command wrapper around _execute above.'''
+    def execute_multi(self, *commands, **kwargs):
+        '''
+        Execute a list of commands in order, stopping at the first failure, returning
+        a list of each commands stdout lines (or raising CommandError like execute).
+        All the commands are sent as one framed script over a single channel, so they
+        cost one round trip rather than one each. Takes execute's sudo, timeout and
+        max_output (for the whole list) kwargs.
+        '''
+
+        if not self._connected:
+            raise self.NotConnected()
+
+        if not commands:
+            return []
+
+        sudo = kwargs.get('sudo', False)
+
+        # The script comes over stdin, so sudo mustn't prompt for a password
+        command = 'sudo -n bash -s' if sudo else 'bash -s'
+        logger.debug('Executing {0} commands on device #{1}: {2}'.format(
+            len(commands), self.id, commands
+        ))
+
+        channel = self._open_channel(command)
+        stderr = []
+
+        try:
+            channel.sendall(self._make_multi_script(commands))
+            channel.shutdown_write()
+
+            stdout = ''.join(self._iter_output(
+                channel, stderr,
+                timeout=kwargs.get('timeout'), max_output=kwargs.get('max_output')
+            ))
+
+            # Ensures the script has finished (all stderr is in)
+            channel.recv_exit_status()
+
+            while channel.recv_stderr_ready():
+                stderr.append(channel.recv_stderr(self.EXECUTE_READ_SIZE))
+
+        except (SSHException, socket_error) as e:
+            self._disconnect_if_dead()
+            raise self.ConnectionError(str(e))
+
+        finally:
+            channel.close()
+
+        outputs, exit_statuses = self._split_multi_output(stdout)
+        errors, _ = self._split_multi_output(''.join(stderr))
+
+        results = []
+
+        for i, command in enumerate(commands):
+            stdout = outputs.get(i, '').splitlines(True)
+            exit_status = exit_statuses.get(i)
+
+            if exit_status is None:
+                raise self.CommandError('No exit status for command: {0}'.format(command))
+
+            if exit_status > 0:
+                raise self.CommandError(
+                    exit_status, errors.get(i, '').splitlines(True), stdout
+                )
+
+            results.append(stdout)
 
-        return [self.execute(command) for command in commands]
+        return results
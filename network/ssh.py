@@ -0,0 +1,146 @@
+# oxy.io Network
+# File: network/ssh.py
+# Desc: process-wide pool of SSH connections to devices
+
+import random
+from socket import error as socket_error
+from time import time
+
+from gevent.lock import Semaphore
+from paramiko import SSHClient, RSAKey, MissingHostKeyPolicy, SSHException
+
+from oxyio import settings
+from oxyio.log import logger
+
+
+class ConnectBackoff(Exception):
+    '''Raised when a connect is attempted while backing off after a failure.'''
+
+
+class SSHPool(object):
+    '''
+    Shares one SSH connection per (host, port, user) between everything running in
+    a worker process - tasks, monitors & ad-hoc commands. Connections are health
+    checked before use, kept alive and reconnected with jittered exponential backoff.
+    '''
+
+    # Seconds between transport keepalive packets
+    KEEPALIVE = 30
+
+    # Reconnect backoff (seconds), doubled per consecutive failure up to the max
+    BACKOFF_MIN = 2
+    BACKOFF_MAX = 300
+
+    def __init__(self):
+        self._pkey = None
+
+        self._clients = {}
+        self._locks = {}
+
+        # key -> (consecutive failures, retry after timestamp)
+        self._failures = {}
+
+    @property
+    def pkey(self):
+        '''The parsed (and decrypted) private key, loaded once per process.'''
+
+        if self._pkey is None:
+            self._pkey = RSAKey.from_private_key_file(
+                filename=settings.SSH_KEY_PRIVATE,
+                password=settings.SSH_KEY_PASSWORD
+            )
+
+        return self._pkey
+
+    def _get_lock(self, key):
+        if key not in self._locks:
+            self._locks[key] = Semaphore()
+
+        return self._locks[key]
+
+    def _is_healthy(self, client):
+        transport = client.get_transport()
+
+        if not transport or not transport.is_active():
+            return False
+
+        # A dead socket only shows itself when written to
+        try:
+            transport.send_ignore()
+        except (SSHException, socket_error, EOFError):
+            return False
+
+        return True
+
+    def _connect(self, host, port, user, password=None):
+        kwargs = {
+            'username': user,
+            'port': port,
+            'timeout': settings.SSH_TIMEOUT
+        }
+
+        if password:
+            kwargs['password'] = password
+        else:
+            kwargs['pkey'] = self.pkey
+
+        client = SSHClient()
+        client.set_missing_host_key_policy(MissingHostKeyPolicy())
+        client.connect(host, **kwargs)
+
+        client.get_transport().set_keepalive(self.KEEPALIVE)
+        return client
+
+    def get(self, host, port, user, password=None, backoff=True):
+        '''
+        Get a healthy connection, reusing the pooled one where possible. Raises the
+        underlying paramiko/socket errors, or ConnectBackoff. User initiated connects
+        (with a password/backoff=False, ie fixed credentials) skip any backoff.
+        '''
+
+        key = (host, port, user)
+
+        # Only one greenlet connects to a given device at once, the rest wait for
+        # and share the result.
+        with self._get_lock(key):
+            client = self._clients.get(key)
+
+            if client:
+                if self._is_healthy(client):
+                    return client
+
+                logger.debug('Dropping dead SSH connection: {0}'.format(key))
+                self.discard(host, port, user)
+
+            failures, retry_at = self._failures.get(key, (0, 0))
+            if backoff and not password and retry_at > time():
+                raise ConnectBackoff('Reconnect backoff, retrying in {0}s'.format(
+                    int(retry_at - time())
+                ))
+
+            try:
+                client = self._connect(host, port, user, password=password)
+
+            except Exception:
+                failures += 1
+                delay = min(self.BACKOFF_MAX, self.BACKOFF_MIN * 2 ** (failures - 1))
+                delay = random.uniform(delay / 2.0, delay)
+
+                self._failures[key] = (failures, time() + delay)
+                raise
+
+            self._failures.pop(key, None)
+            self._clients[key] = client
+
+            return client
+
+    def discard(self, host, port, user):
+        '''Close & remove a pooled connection (ie after a failed command).'''
+
+        client = self._clients.pop((host, port, user), None)
+
+        if client:
+            client.close()
+
+
+ssh_pool = SSHPool()
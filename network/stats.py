@@ -0,0 +1,359 @@
+# oxy.io Network
+# File: network/stats.py
+# Desc: query device stats from Elasticsearch
+
+from __future__ import division
+
+import math
+import re
+from time import time
+
+from elasticsearch.helpers import scan
+
+from oxyio import settings
+from oxyio.app import es_client, task_app
+
+
+# Stats stored as the difference between ticks, which are summed (rather than
+# averaged) when bucketed.
+TOTAL_STAT_TYPES = ('disk_io', 'network_io')
+
+# Default range & number of buckets when none is requested
+DEFAULT_RANGE = 3600
+DEFAULT_BUCKETS = 60
+
+# Hard cap on points per series, whatever the range/interval requested, and the
+# least that can be asked for (LTTB keeps the first & last points plus one per bucket)
+MAX_POINTS = 2000
+MIN_POINTS = 3
+
+# When picking an interval for max_points, fetch this many times more buckets so the
+# downsampling has some shape to preserve.
+DOWNSAMPLE_FACTOR = 4
+
+
+# Rollup resolutions (name, seconds) maintained at ingest, finest first
+ROLLUP_RESOLUTIONS = (
+    ('minute', 60),
+    ('hour', 3600),
+    ('day', 86400)
+)
+
+INTERVAL_UNITS = {
+    's': 1,
+    'm': 60,
+    'h': 3600,
+    'd': 86400
+}
+
+
+def get_raw_stats_index():
+    # The flat per key documents get their own index, as the stats template only
+    # applies to indexes created after it (& the core stats index is older).
+    return '{0}-raw'.format(settings.ES_STATS_INDEX)
+
+
+def get_rollup_index(resolution):
+    return '{0}-{1}'.format(settings.ES_STATS_INDEX, resolution)
+
+
+def _get_rollup_resolution(interval):
+    # The coarsest (resolution, seconds) that fits in a bucket of interval seconds
+    rollup = None
+
+    for resolution, seconds in ROLLUP_RESOLUTIONS:
+        if seconds > interval:
+            break
+
+        rollup = resolution, seconds
+
+    return rollup
+
+
+def get_stats_index(interval):
+    '''
+    Get the index to read buckets of interval seconds from: the coarsest rollup
+    resolution that fits in a bucket, or the raw stats.
+    '''
+
+    rollup = _get_rollup_resolution(interval)
+
+    if rollup:
+        return get_rollup_index(rollup[0])
+
+    return get_raw_stats_index()
+
+
+def _parse_interval(interval):
+    # Seconds from 300, "300", "5m", "1h", etc
+    matches = re.match(r'^([0-9]+)([smhd]?)$', str(interval or ''))
+
+    if matches:
+        number, unit = matches.groups()
+        return int(number) * INTERVAL_UNITS[unit or 's']
+
+
+def get_max_points(max_points=None):
+    '''Clamp a requested max_points to [MIN_POINTS, MAX_POINTS].'''
+
+    if max_points is None:
+        return MAX_POINTS
+
+    return min(max(max_points, MIN_POINTS), MAX_POINTS)
+
+
+def downsample(points, threshold):
+    '''
+    Downsample [[x, y], ...] to threshold points with Largest-Triangle-Three-Buckets,
+    which keeps the peaks & troughs that averaging would flatten.
+    '''
+
+    threshold = get_max_points(threshold)
+
+    length = len(points)
+    if threshold >= length:
+        return points
+
+    sampled = [points[0]]
+    every = (length - 2) / (threshold - 2)
+    previous = 0
+
+    for i in xrange(threshold - 2):
+        # Average of the next bucket, the third point of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, length)
+        next_count = next_end - next_start
+
+        avg_x = sum(point[0] for point in points[next_start:next_end]) / next_count
+        avg_y = sum(point[1] for point in points[next_start:next_end]) / next_count
+
+        # Pick the point in this bucket making the largest triangle
+        previous_x, previous_y = points[previous]
+        max_area = -1
+
+        for j in xrange(int(i * every) + 1, next_start):
+            x, y = points[j]
+            area = abs(
+                (previous_x - avg_x) * (y - previous_y)
+                - (previous_x - x) * (avg_y - previous_y)
+            )
+
+            if area > max_area:
+                max_area = area
+                selected = j
+
+        sampled.append(points[selected])
+        previous = selected
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def get_interval(since, to, interval=None, max_points=None):
+    '''
+    Get the bucket interval (whole seconds) for a stats query, either as requested or
+    picked to give enough buckets for max_points/DEFAULT_BUCKETS, rounded up to a
+    multiple of the rollup resolution it will be read from.
+    '''
+
+    interval = _parse_interval(interval)
+
+    if not interval:
+        if max_points is not None:
+            buckets = get_max_points(max_points) * DOWNSAMPLE_FACTOR
+        else:
+            buckets = DEFAULT_BUCKETS
+
+        interval = (to - since) / buckets
+
+    # However small an interval is asked for, never fetch more buckets than we'd
+    # pick for MAX_POINTS.
+    interval = max(interval, (to - since) / (MAX_POINTS * DOWNSAMPLE_FACTOR))
+
+    # ES date_histogram doesn't take fractions
+    interval = max(1, int(math.ceil(interval)))
+
+    # Buckets read from a rollup must hold a whole number of rollup documents, or
+    # they alternate between holding more & fewer (a sawtooth in summed stats).
+    rollup = _get_rollup_resolution(interval)
+
+    if rollup:
+        seconds = rollup[1]
+        interval = -(-interval // seconds) * seconds
+
+    return interval
+
+
+def get_stats(
+    filters, type_, keys=None, details=None,
+    since=None, to=None, interval=None, max_points=None
+):
+    '''
+    Get bucketed stats of one type as ``{key: {detail: [[timestamp_ms, value]]}}``,
+    defaulting to the last hour in DEFAULT_BUCKETS buckets. Wide buckets are read
+    from the ingest rollups rather than the raw stats. Each series is downsampled to
+    at most max_points (clamped to MIN_POINTS-MAX_POINTS).
+    '''
+
+    to = to or int(time())
+    since = since or to - DEFAULT_RANGE
+
+    interval = get_interval(since, to, interval=interval, max_points=max_points)
+    max_points = get_max_points(max_points)
+
+    details = details or []
+    aggregate = 'sum' if type_ in TOTAL_STAT_TYPES else 'avg'
+
+    filters = list(filters) + [
+        {'term': {'type': type_}},
+        {'range': {'datetime': {
+            'gte': since * 1000,
+            'lt': to * 1000,
+            'format': 'epoch_millis'
+        }}}
+    ]
+
+    if keys:
+        filters.append({'terms': {'key': keys}})
+
+    query = {
+        'query': {'bool': {'filter': filters}},
+        'size': 0,
+        'aggregations': {
+            'keys': {
+                'terms': {'field': 'key', 'size': 0},
+                'aggregations': {
+                    'datetime': {
+                        'date_histogram': {
+                            'field': 'datetime',
+                            'interval': '{0}s'.format(interval),
+                            'min_doc_count': 1
+                        },
+                        'aggregations': {
+                            detail: {aggregate: {'field': detail}}
+                            for detail in details
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+    result = es_client.search(index=get_stats_index(interval), body=query)
+
+    stats = {}
+
+    for key_bucket in result['aggregations']['keys']['buckets']:
+        key_stats = stats[key_bucket['key']] = {
+            detail: []
+            for detail in details
+        }
+
+        for bucket in key_bucket['datetime']['buckets']:
+            for detail in details:
+                value = bucket[detail]['value']
+
+                if value is not None:
+                    key_stats[detail].append([bucket['key'], value])
+
+        for detail, points in key_stats.iteritems():
+            key_stats[detail] = downsample(points, max_points)
+
+    return stats
+
+
+def iter_stats_documents(
+    filters, type_, keys=None, since=None, to=None, resolution=None,
+    page_size=1000
+):
+    '''
+    Yield the stored stat documents (raw, or from a ROLLUP_RESOLUTIONS rollup) of one
+    type in datetime order, scrolling page_size at a time so long ranges can be read
+    in constant memory. Defaults to the last DEFAULT_RANGE.
+    '''
+
+    to = to or int(time())
+    since = since or to - DEFAULT_RANGE
+
+    if resolution:
+        index = get_rollup_index(resolution)
+    else:
+        index = get_raw_stats_index()
+
+    filters = list(filters) + [
+        {'term': {'type': type_}},
+        {'range': {'datetime': {
+            'gte': since * 1000,
+            'lt': to * 1000,
+            'format': 'epoch_millis'
+        }}}
+    ]
+
+    if keys:
+        filters.append({'terms': {'key': keys}})
+
+    query = {
+        'query': {'bool': {'filter': filters}},
+        'sort': [{'datetime': 'asc'}]
+    }
+
+    for hit in scan(
+        es_client, index=index, query=query,
+        size=page_size, preserve_order=True
+    ):
+        yield hit['_source']
+
+
+def get_stat_keys(filters, type_):
+    '''Get the distinct keys (ie interfaces, disks) stored for a stat type.'''
+
+    query = {
+        'query': {'bool': {'filter': list(filters) + [
+            {'term': {'type': type_}}
+        ]}},
+        'size': 0,
+        'aggregations': {
+            'keys': {'terms': {'field': 'key', 'size': 0}}
+        }
+    }
+
+    result = es_client.search(index=get_raw_stats_index(), body=query)
+
+    return sorted(
+        bucket['key']
+        for bucket in result['aggregations']['keys']['buckets']
+    )
+
+
+def get_object_filters(obj):
+    module, type_ = obj.NAME.split('/', 1)
+
+    return [
+        {'term': {'object_module': module}},
+        {'term': {'object_type': type_}},
+        {'term': {'object_id': obj.id}}
+    ]
+
+
+def get_object_stat_keys_key(obj, type_):
+    '''Get the Redis set of an objects stat keys, maintained by its monitor.'''
+
+    return 'network-stat-keys-{0}-{1}-{2}'.format(obj.NAME, obj.id, type_)
+
+
+def get_object_stats(obj, **kwargs):
+    return get_stats(get_object_filters(obj), **kwargs)
+
+
+def get_object_stat_keys(obj, type_):
+    '''
+    Get an objects current stat keys from the set its monitor keeps, falling back to
+    searching the stored stats (ie not monitored since the set was introduced).
+    '''
+
+    keys = task_app.redis.smembers(get_object_stat_keys_key(obj, type_))
+
+    if keys:
+        return sorted(keys)
+
+    return get_stat_keys(get_object_filters(obj), type_)
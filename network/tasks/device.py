@@ -2,24 +2,37 @@
 # File: network/tasks/device_check.py
 # Desc: run arbitrary checks on devices and report status back
 
-import gevent
-from pytask.helpers import run_loop
+from gevent.lock import Semaphore
+from gevent.pool import Pool
 
-from oxyio import settings
+from oxyio.app import db
 from oxyio.tasks.base import Task
 from oxyio.log import logger
 
 from ..models.device import Device
-from .util.parse_stats import (
-    parse_cpu_stats, parse_memory_stats, parse_disk_stats,
-    parse_disk_io_stats, parse_network_io_stats
-)
+from .util.bootstrap import bootstrap_device, BootstrapError
+from .util.facts import collect_facts, save_facts
+
+
+# Deadline for the on demand & bootstrap fact collections (bootstrap facts are
+# otherwise first collected in the devices monitor FACTS_INTERVAL phase)
+FACTS_TIMEOUT = 60
+
+
+def collect_bootstrap_facts(device):
+    '''Collects a freshly bootstrapped devices facts, returning None on failure.'''
+
+    try:
+        return collect_facts(device, timeout=FACTS_TIMEOUT)
+
+    except device.DeviceError as e:
+        logger.warning('Could not collect facts from {0}: {1}'.format(device, e))
 
 
 class Connect(Task):
     '''
     Connects to a server to verify first connect/ssh details change. Upon success,
-    updates the device in db and starts a network/device_monitor task for it.
+    updates the device in db and adds it to its network/monitor_scheduler shard.
     '''
 
     NAME = 'network/device_connect'
@@ -29,160 +42,133 @@ class Connect(Task):
         self.password = password
 
     def start(self):
-        # Try connecting, or fail/end w/error
         try:
-            self.device.connect(password=self.password)
+            bootstrap_device(self.device, password=self.password)
 
-        except self.device.ConnectionError as e:
-            self.device.ssh_connected = False
+        except BootstrapError as e:
+            raise self.Error(str(e))
+
+        finally:
             self.device.save()
 
-            raise self.Error('Could not connect: {0}'.format(e))
+        facts = collect_bootstrap_facts(self.device)
+        if facts:
+            save_facts(self.device, facts)
 
-        public_key = open(settings.SSH_KEY_PUBLIC).read()
+        # Start the device's tasks
+        self.device.start_monitor()
 
-        try:
-            # Attempt to write SSH key
-            self.device.execute_multi(
-                # Setup .ssh and authorized_keys
-                'mkdir -p ~/.ssh',
-                'touch ~/.ssh/authorized_keys',
-                # Write the pubkey if not present
-                'cat ~/.ssh/authorized_keys | grep "{0}" || echo "{0}" >> ~/.ssh/authorized_key'.format(public_key),
-                # Ensure permissions
-                'chmod 700 ~/.ssh',
-                'chmod 600 ~/.ssh/authorized_keys',
-            )
 
-        except self.device.CommandError as e:
-            self.device.ssh_connected = False
-            self.device.save()
+class BulkConnect(Task):
+    '''
+    Connects & bootstraps many (newly added) devices, at most CONCURRENCY at a time,
+    emitting a progress event as each finishes.
+    '''
 
-            raise self.Error('Error adding key: {0}'.format(e))
+    NAME = 'network/device_bulk_connect'
 
-        # Set ssh_connected
-        self.device.ssh_connected = True
-        self.device.save()
+    CONCURRENCY = 25
 
-        # Start the device's tasks
-        self.device.start_monitor()
+    def __init__(self, devices):
+        # List of (device_id, password) - JSON has no int keys for a dict
+        self.passwords = dict(devices)
+        self.devices = Device.query.filter(Device.id.in_(self.passwords.keys())).all()
 
+        # Greenlets share the DB session, detach the (loaded) devices so one greenlets
+        # commit can't expire the others, which would then lazy load concurrently.
+        for device in self.devices:
+            db.session.expunge(device)
 
-class Facts(Task):
-    NAME = 'network/device_facts'
+        self.pool = Pool(self.CONCURRENCY)
 
-    def __init__(self, device_id):
-        self.device = Device.query.get(device_id)
+        # And write to it one at a time
+        self.save_lock = Semaphore()
+
+        self.connected = []
+        self.failed = []
 
     def start(self):
+        for device in self.devices:
+            # Blocks while the pool is full
+            self.pool.spawn(self.connect_device, device)
+
+        self.pool.join()
+
+        self.emit('complete', {
+            'connected': self.connected,
+            'failed': self.failed
+        })
+
+        if self.failed:
+            raise self.Error('Failed to connect {0}/{1} devices'.format(
+                len(self.failed), len(self.devices)
+            ))
+
+    def stop(self):
+        self.pool.kill()
+
+    def connect_device(self, device):
+        error = facts = None
+
         try:
-            self.device.connect()
+            bootstrap_device(device, password=self.passwords.get(device.id))
 
-        except self.device.ConnectionError:
-            raise self.Error('Could not connect to device')
+        except BootstrapError as e:
+            error = str(e)
 
+        else:
+            facts = collect_bootstrap_facts(device)
 
-class Monitor(Task):
-    '''
-    Monitors a devices CPU/memory/disk/IO stats & writes/published to
-    Elasticsearch/Redis.
-    '''
+        with self.save_lock:
+            Device.query.filter_by(id=device.id).update(
+                {'ssh_connected': device.ssh_connected},
+                synchronize_session=False
+            )
+            db.session.commit()
+
+            if facts:
+                save_facts(device, facts)
+
+        if error:
+            self.failed.append(device.id)
+        else:
+            self.connected.append(device.id)
+            device.start_monitor()
 
-    NAME = 'network/device_monitor'
+        self.emit('progress', {
+            'device_id': device.id,
+            'name': device.name,
+            'error': error,
+            'completed': len(self.connected) + len(self.failed),
+            'total': len(self.devices)
+        })
 
-    FIXED_STATS = (
-        ('cpu', 'cat /proc/stat; sleep 1; cat /proc/stat', parse_cpu_stats),
-        ('memory', 'cat /proc/meminfo', parse_memory_stats),
-        ('disk', 'df -PB 1000', parse_disk_stats)
-    )
 
-    TOTAL_STATS = (
-        ('disk_io', 'cat /proc/diskstats', parse_disk_io_stats),
-        ('network_io', 'cat /proc/net/dev', parse_network_io_stats)
-    )
+class Facts(Task):
+    '''
+    Collects a devices facts now (they are otherwise collected every
+    DeviceMonitor.FACTS_INTERVAL by its monitor scheduler).
+    '''
+
+    NAME = 'network/device_facts'
 
     def __init__(self, device_id):
-        # Get our device based on the task data
         self.device = Device.query.get(device_id)
 
-        self._previous_stats = {}
-
     def start(self):
-        # Connect
         try:
             self.device.connect()
 
         except self.device.ConnectionError:
             raise self.Error('Could not connect to device')
 
-        # Start the loop in a greenlet
-        logger.debug('Starting device monitor loop on: {0}'.format(self.device))
-        self.loop = gevent.spawn(run_loop, self.get_stats, self.device.stat_interval)
+        try:
+            facts = collect_facts(self.device, timeout=FACTS_TIMEOUT)
 
-        self.loop.get()
+        # Including connection errors & timeouts mid collection
+        except self.device.DeviceError as e:
+            raise self.Error('Error collecting facts: {0}'.format(e))
 
-    def stop(self):
-        if self.loop:
-            self.loop.kill()
-
-    def get_stats(self):
-        '''
-        Fetches the stats defined above in parallel, processes them and queue to be
-        indexed in ES.
-        '''
-
-        # Fetch the stats in parallel
-        stat_requests = {
-            type_: gevent.spawn(self.device.execute, command)
-            for type_, command, _ in list(self.FIXED_STATS) + list(self.TOTAL_STATS)
-        }
-
-        index_stats = []
-
-        # Fixed stats are simple, for each one just populate the values
-        for type_, _, parser in self.FIXED_STATS:
-            stats = parser(stat_requests[type_].get())
-            new_stats = []
-
-            for key, values in stats.iteritems():
-                for detail, value in values.iteritems():
-                    new_stats.append({
-                        'type': type_,
-                        'key': key,
-                        'detail': detail,
-                        'value': value
-                    })
-
-            # Emit to Redis, push to index buffer
-            self.emit(type_, new_stats)
-            index_stats.extend(new_stats)
-
-        # Total stats, however, require the previous values
-        for type_, _, parser in self.TOTAL_STATS:
-            stats = parser(stat_requests[type_].get())
-
-            if type_ in self._previous_stats:
-                new_stats = []
-
-                for key, values in stats.iteritems():
-                    if key not in self._previous_stats[type_]:
-                        continue
-
-                    for detail, value in values.iteritems():
-                        diff = value - self._previous_stats[type_][key][detail]
-
-                        new_stats.append({
-                            'type': type_,
-                            'key': key,
-                            'detail': detail,
-                            'value': diff
-                        })
-
-                # Emit to Redis, push to index buffer
-                self.emit(type_, new_stats)
-                index_stats.extend(new_stats)
-
-            self._previous_stats[type_] = stats
-
-        # Index the stats in ES
-        self.device.index_stats(index_stats)
+        self.emit('facts', {
+            'changed': save_facts(self.device, facts)
+        })
@@ -0,0 +1,128 @@
+# oxy.io Network
+# File: network/tasks/fleet.py
+# Desc: run commands across many devices at once
+
+from gevent.pool import Pool
+
+from oxyio.tasks.base import Task
+from oxyio.log import logger
+
+from ..models.device import Device
+
+
+class Execute(Task):
+    '''
+    Runs a list of commands on every device in a list of devices, at most
+    concurrency devices at a time over the pooled SSH connections. Each devices
+    results are emitted as it finishes, stopping at its first failed command.
+    '''
+
+    NAME = 'network/fleet_execute'
+
+    DEFAULT_CONCURRENCY = 50
+    MAX_CONCURRENCY = 500
+
+    # Cap on each commands output
+    MAX_OUTPUT = 1024 * 1024
+
+    # Deadline for each command, so a hung one can't hold its pool slot forever
+    DEFAULT_TIMEOUT = 300
+    MAX_TIMEOUT = 3600
+
+    def __init__(
+        self, commands, device_ids,
+        sudo=False, concurrency=None, timeout=None
+    ):
+        self.commands = commands
+        self.sudo = sudo
+        self.timeout = min(timeout or self.DEFAULT_TIMEOUT, self.MAX_TIMEOUT)
+
+        # Always explicit IDs, which the views have checked permissions on
+        self.devices = Device.query.filter(Device.id.in_(device_ids)).all()
+
+        self.pool = Pool(min(
+            concurrency or self.DEFAULT_CONCURRENCY,
+            self.MAX_CONCURRENCY
+        ))
+
+        self.succeeded = []
+        self.failed = []
+
+    def start(self):
+        self.emit('start', {
+            'devices': len(self.devices),
+            'commands': self.commands
+        })
+
+        for device in self.devices:
+            # Blocks while the pool is full
+            self.pool.spawn(self.execute_device, device)
+
+        self.pool.join()
+
+        self.emit('complete', {
+            'succeeded': self.succeeded,
+            'failed': self.failed
+        })
+
+        if self.failed:
+            raise self.Error('Failed on {0}/{1} devices'.format(
+                len(self.failed), len(self.devices)
+            ))
+
+    def stop(self):
+        self.pool.kill()
+
+    def execute_device(self, device):
+        results = []
+        error = None
+
+        try:
+            device.connect()
+
+            for command in self.commands:
+                result = {
+                    'command': command,
+                    'exit_status': 0,
+                    'stdout': '',
+                    'stderr': ''
+                }
+                results.append(result)
+
+                try:
+                    result['stdout'] = device.execute(
+                        command, sudo=self.sudo, raw=True,
+                        timeout=self.timeout, max_output=self.MAX_OUTPUT
+                    )
+
+                # Timeouts/output limits have only a message
+                except (Device.CommandTimeoutError, Device.CommandOutputError) as e:
+                    result['exit_status'] = None
+                    error = str(e)
+                    break
+
+                except Device.CommandError as e:
+                    exit_status, stderr, stdout = e.args
+                    result.update({
+                        'exit_status': exit_status,
+                        'stdout': stdout,
+                        'stderr': stderr
+                    })
+                    error = 'Exited with status {0}'.format(exit_status)
+                    break
+
+        except Device.DeviceError as e:
+            error = str(e) or e.__class__.__name__
+
+        if error:
+            logger.debug('Fleet execute failed on {0}: {1}'.format(device, error))
+            self.failed.append(device.id)
+        else:
+            self.succeeded.append(device.id)
+
+        self.emit('device', {
+            'device_id': device.id,
+            'name': device.name,
+            'error': error,
+            'results': results
+        })
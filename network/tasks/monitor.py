@@ -0,0 +1,798 @@
+# oxy.io Network
+# File: network/tasks/monitor.py
+# Desc: the device monitor & the scheduler task running many of them
+
+import json
+from datetime import datetime
+from heapq import heappush, heappop
+from time import time
+
+import gevent
+from gevent.event import Event
+from gevent.lock import Semaphore
+from gevent.pool import Pool
+from pytask.helpers import run_loop
+
+from oxyio.app import db, task_app
+from oxyio.tasks.base import Task
+from oxyio.log import logger
+
+from ..leaderboard import update_leaderboards, remove_from_leaderboards
+from ..models.device import Device
+from ..stats import get_object_stat_keys_key
+from .util.agent import install_agent, make_agent_command
+from .util.collect import (
+    make_framed_command, split_framed_output, iter_framed_samples
+)
+from .util.facts import collect_facts, save_facts
+from .util.ingest import (
+    stat_buffer, make_stats_documents, ensure_stats_template
+)
+from .util.parse_stats import (
+    parse_cpu_stats, parse_memory_stats, parse_disk_stats,
+    parse_disk_io_stats, parse_network_io_stats,
+    calculate_cpu_percentages, calculate_differences
+)
+from .util.processes import (
+    install_processes, make_processes_command, iter_process_samples
+)
+from .util.rollup import StatRollups
+
+
+class DeviceMonitor(object):
+    '''
+    Monitors a devices CPU/memory/disk/IO stats & writes/publishes to
+    Elasticsearch/Redis. Many of these are run by a single Scheduler task.
+    '''
+
+    FIXED_STATS = (
+        ('memory', 'cat /proc/meminfo', parse_memory_stats),
+        ('disk', 'df -PB 1000', parse_disk_stats)
+    )
+
+    # Calculated from this & the previous ticks parsed values
+    TOTAL_STATS = (
+        (
+            'cpu', 'cat /proc/stat',
+            parse_cpu_stats, calculate_cpu_percentages
+        ),
+        (
+            'disk_io', 'cat /proc/diskstats',
+            parse_disk_io_stats, calculate_differences
+        ),
+        (
+            'network_io', 'cat /proc/net/dev',
+            parse_network_io_stats, calculate_differences
+        )
+    )
+
+    # (type, command) for every stat
+    COMMANDS = tuple(stat[:2] for stat in FIXED_STATS + TOTAL_STATS)
+
+    # Cap on the output of a collection (ie df on hosts with thousands of mounts)
+    MAX_OUTPUT = 8 * 1024 * 1024
+
+    # How often facts (OS, packages, etc) are collected & how long they can take
+    FACTS_INTERVAL = 6 * 3600
+    FACTS_TIMEOUT = 60
+
+    # Process sampling interval & number of top processes (by CPU and by memory)
+    # sent, while the processes tab is open.
+    PROCESSES_INTERVAL = 2
+    PROCESSES_COUNT = 10
+
+    def __init__(self, device, rollups=None):
+        self.device = device
+
+        # Publish to the devices own "task" so websocket subscribers (see
+        # Device.pre_view) receive events as if it had a monitor task of its own.
+        self.channel = '{0}{1}'.format(
+            task_app.REDIS_TASK_PREFIX, device.monitor_task_id
+        )
+
+        # Previous values for total stats, emitted every tick & indexed every interval
+        self._previous_stats = {}
+        self._previous_index_stats = {}
+        self._next_index_at = 0
+
+        # Tagged onto every stat document, the monitor is reloaded when these change
+        self.group_ids = [group.id for group in device.groups]
+
+        # Carry on with the previous monitors open rollup buckets when reloaded
+        if rollups:
+            rollups.obj = device
+            rollups.group_ids = self.group_ids
+        else:
+            rollups = StatRollups(device, group_ids=self.group_ids)
+
+        self.rollups = rollups
+        self.stopped = False
+
+        # type -> the keys last written to the devices stat key sets
+        self._stat_keys = {}
+
+        # Live stats lease interval & the next tick scheduled, set by the scheduler
+        self.live_interval = None
+        self.next_tick_at = None
+
+        # Whether anyone is listening on the channel, kept up to date by the scheduler
+        self.subscribed = False
+
+        self.agent = None
+
+        # The process sampler, which only runs while its channel has subscribers
+        self.processes_channel = '{0}{1}'.format(
+            task_app.REDIS_TASK_PREFIX, device.processes_task_id
+        )
+        self.processes = None
+
+        self.next_facts_at = self.get_next_facts(time())
+
+    def __repr__(self):
+        return '<DeviceMonitor: {0}>'.format(self.device)
+
+    @property
+    def interval(self):
+        return self.device.stat_interval
+
+    @property
+    def tick_interval(self):
+        return self.live_interval or self.interval
+
+    def get_phase(self, interval):
+        '''
+        Offset of this devices ticks within an interval. Spread by hashing the device
+        ID (Knuth multiplicative, so sequential IDs are evenly spaced), this is stable
+        across restarts/reloads and stops every device ticking at once.
+        '''
+
+        return (self.device.id * 2654435761 % 2 ** 32) / 2.0 ** 32 * interval
+
+    @property
+    def phase(self):
+        return self.get_phase(self.interval)
+
+    def _get_next_in_phase(self, now, interval):
+        tick_at = now - (now % interval) + self.get_phase(interval)
+
+        if tick_at < now:
+            tick_at += interval
+
+        return tick_at
+
+    def get_next_tick(self, now):
+        '''Get the first tick at/after now that's on this devices phase.'''
+
+        return self._get_next_in_phase(now, self.interval)
+
+    def get_next_facts(self, now):
+        '''Get the first fact collection after now, on the FACTS_INTERVAL phase.'''
+
+        return self._get_next_in_phase(now, self.FACTS_INTERVAL)
+
+    @property
+    def is_agent(self):
+        return self.device.stat_mode == 'Agent'
+
+    def emit(self, event, data=None, channel=None):
+        # Nobody watching, don't bother serializing/publishing
+        if not channel and not self.subscribed:
+            return
+
+        task_app.redis.publish(channel or self.channel, json.dumps({
+            'event': event,
+            'data': data
+        }))
+
+    def connect(self):
+        # Always via the pool, which health checks & reconnects (with backoff)
+        self.device.connect()
+
+    def start(self):
+        '''Starts the collector agent greenlet (Agent stat mode only).'''
+
+        logger.debug('Starting device monitor agent on: {0}'.format(self.device))
+
+        now = time()
+        self.agent = gevent.spawn_later(self.get_next_tick(now) - now, self.run_agent)
+
+    def stop(self, flush=True):
+        self.stopped = True
+
+        if self.agent:
+            self.agent.kill()
+
+        self.set_processes_subscribed(False)
+
+        # Write out the open rollup buckets (unless being handed to a new monitor).
+        # Stopping happens under the schedulers DB lock, so drop them rather than
+        # wait on ES when the buffer is full.
+        if flush:
+            dropped = sum(
+                1 for document in self.rollups.flush()
+                if not stat_buffer.add(document, block=False)
+            )
+
+            if dropped:
+                logger.warning('Dropped {0} rollup documents from {1}, buffer full'.format(
+                    dropped, self.device
+                ))
+
+        remove_from_leaderboards(self.device.id)
+
+    def set_live_interval(self, live_interval):
+        '''Update the live stats lease, returns whether it changed.'''
+
+        if live_interval == self.live_interval:
+            return False
+
+        self.live_interval = live_interval
+
+        # The agent samples at a fixed rate, so restart it at the new one
+        if self.agent:
+            self.agent.kill()
+            self.start()
+
+        return True
+
+    def set_processes_subscribed(self, subscribed):
+        '''Starts/stops the process sampler as the processes tab is opened/closed.'''
+
+        if subscribed and not self.processes:
+            self.processes = gevent.spawn(self.run_processes)
+
+        elif not subscribed and self.processes:
+            # Closes the channel, which stops the remote sampler
+            self.processes.kill()
+            self.processes = None
+
+    def run_processes(self):
+        '''
+        Streams top process samples to the processes channel, restarting the sampler
+        if the connection drops or it dies.
+        '''
+
+        while True:
+            try:
+                self.connect()
+                install_processes(self.device)
+
+                lines = self.device.execute_stream(make_processes_command(
+                    self.PROCESSES_INTERVAL, self.PROCESSES_COUNT
+                ))
+
+                for sample in iter_process_samples(lines):
+                    self.emit('processes', sample, channel=self.processes_channel)
+
+            except Device.DeviceError as e:
+                logger.warning('Device process sampler error on {0}: {1}'.format(
+                    self.device, e
+                ))
+
+            gevent.sleep(self.PROCESSES_INTERVAL)
+
+    def is_index_due(self):
+        '''
+        Whether this ticks stats should be indexed - with live stats many ticks are
+        only emitted, and one per stat interval is indexed.
+        '''
+
+        now = time()
+
+        if now < self._next_index_at:
+            return False
+
+        self._next_index_at = self.get_next_tick(now)
+        return True
+
+    def tick(self):
+        '''
+        Fetches the stats defined above, processes them and queue to be indexed in ES.
+        '''
+
+        self.connect()
+
+        if self.device.stat_mode == 'Parallel':
+            outputs = self.collect_parallel()
+        else:
+            outputs = self.collect_batch()
+
+        self.process_stats(outputs, index=self.is_index_due())
+
+    def collect_parallel(self):
+        '''Fetches each stat in parallel, over its own channel.'''
+
+        stat_requests = {
+            type_: gevent.spawn(
+                self.device.execute, command,
+                raw=True, timeout=self.interval, max_output=self.MAX_OUTPUT
+            )
+            for type_, command in self.COMMANDS
+        }
+
+        return {
+            type_: request.get()
+            for type_, request in stat_requests.iteritems()
+        }
+
+    def collect_batch(self):
+        '''Fetches every stat with a single framed command/channel.'''
+
+        command = make_framed_command(self.COMMANDS)
+
+        output = self.device.execute(
+            command,
+            raw=True, timeout=self.interval, max_output=self.MAX_OUTPUT
+        )
+
+        return split_framed_output(output)
+
+    def run_agent(self):
+        '''
+        Keeps the collector agent running, restarting it (after a stat interval) if
+        the connection drops or the agent dies.
+        '''
+
+        while True:
+            try:
+                self.connect()
+                install_agent(self.device)
+                self.stream_agent()
+
+            except Device.DeviceError as e:
+                logger.warning('Device monitor agent error on {0}: {1}'.format(
+                    self.device, e
+                ))
+
+                # Don't rank the device on stats it's no longer reporting
+                remove_from_leaderboards(self.device.id)
+
+            gevent.sleep(self.tick_interval)
+
+    def stream_agent(self):
+        '''
+        Runs the collector agent over a single long-lived channel, processing each
+        sample it pushes until stopped.
+        '''
+
+        lines = self.device.execute_stream(make_agent_command(self.tick_interval))
+
+        for outputs in iter_framed_samples(lines):
+            self.process_stats(outputs, index=self.is_index_due())
+
+    def collect_facts(self):
+        '''Collects the devices facts, returning None on failure.'''
+
+        self.next_facts_at = self.get_next_facts(time() + 1)
+
+        try:
+            self.connect()
+            return collect_facts(self.device, timeout=self.FACTS_TIMEOUT)
+
+        except Device.DeviceError as e:
+            logger.warning('Device fact collection error on {0}: {1}'.format(
+                self.device, e
+            ))
+
+    def process_stats(self, outputs, index=True):
+        '''Parses collected stat output, emits to Redis & (optionally) indexes in ES.'''
+
+        # A tick finishing after a reload, the rollups belong to the new monitor
+        if self.stopped:
+            return
+
+        # Stats are kept as the parsers {key: {detail: value}} dicts throughout
+        emit_stats = {}
+        index_stats = {}
+
+        # Fixed stats are simple, the parsed values are the stats
+        for type_, _, parser in self.FIXED_STATS:
+            emit_stats[type_] = index_stats[type_] = parser(outputs.get(type_, ''))
+
+        # Total stats, however, require the previous values
+        for type_, _, parser, calculate in self.TOTAL_STATS:
+            stats = parser(outputs.get(type_, ''))
+
+            previous_stats = self._previous_stats.get(type_)
+            if previous_stats is not None:
+                emit_stats[type_] = calculate(previous_stats, stats)
+
+            # Indexed stats are relative to the last indexed tick, which is the last
+            # tick unless we're sampling live stats.
+            if index:
+                previous_index_stats = self._previous_index_stats.get(type_)
+
+                if previous_index_stats is previous_stats:
+                    if type_ in emit_stats:
+                        index_stats[type_] = emit_stats[type_]
+
+                elif previous_index_stats is not None:
+                    index_stats[type_] = calculate(previous_index_stats, stats)
+
+                self._previous_index_stats[type_] = stats
+
+            self._previous_stats[type_] = stats
+
+        for type_, stats in emit_stats.iteritems():
+            self.emit(type_, stats)
+
+        self.update_stat_keys(emit_stats)
+
+        if not index:
+            return
+
+        now = time()
+        when = datetime.utcfromtimestamp(now)
+
+        # Push to the index buffer, along with any rollups ready to be written
+        for type_, stats in index_stats.iteritems():
+            for document in make_stats_documents(
+                self.device, type_, stats,
+                when=when, group_ids=self.group_ids
+            ):
+                stat_buffer.add(document)
+
+        for document in self.rollups.add(index_stats, now):
+            stat_buffer.add(document)
+
+        update_leaderboards(self.device.id, index_stats, self.interval)
+
+    def update_stat_keys(self, stats):
+        '''
+        Keeps the devices stat key sets (see stats.get_object_stat_keys) up to date,
+        only writing to Redis when a types keys change (ie a disk is mounted).
+        '''
+
+        pipe = None
+
+        for type_, type_stats in stats.iteritems():
+            keys = frozenset(type_stats)
+
+            # Empty output (ie a failed command) isn't a reason to forget the keys
+            if not keys or keys == self._stat_keys.get(type_):
+                continue
+
+            if pipe is None:
+                pipe = task_app.redis.pipeline()
+
+            redis_key = get_object_stat_keys_key(self.device, type_)
+            pipe.delete(redis_key)
+            pipe.sadd(redis_key, *keys)
+
+            self._stat_keys[type_] = keys
+
+        if pipe is not None:
+            pipe.execute()
+
+
+class Scheduler(Task):
+    '''
+    Runs the DeviceMonitors for one shard of devices (see Device.MONITOR_SHARDS).
+    Collection ticks are run from a single priority queue in a bounded greenlet pool.
+    Devices are synced from the DB, and reloaded early via the shards Redis set.
+    '''
+
+    NAME = 'network/monitor_scheduler'
+
+    # Max concurrent collection ticks
+    POOL_SIZE = 200
+
+    # How often to sync the shards devices from the DB & the Redis reload set
+    SYNC_INTERVAL = 5
+
+    # How often to count subscribers to the monitors channels
+    SUBSCRIBER_INTERVAL = 2
+
+    # How often to check for devices due fact collection, & how many to collect at once
+    FACTS_CHECK_INTERVAL = 60
+    FACTS_POOL_SIZE = 10
+
+    def __init__(self, shard):
+        self.shard = shard
+
+        # device_id -> DeviceMonitor
+        self.monitors = {}
+
+        # Heap of (tick_at, device_id, monitor)
+        self.queue = []
+        self.queue_changed = Event()
+
+        self.pool = Pool(self.POOL_SIZE)
+        self.facts_pool = Pool(self.FACTS_POOL_SIZE)
+
+        # The sync & facts loops share the DB session
+        self.db_lock = Semaphore()
+
+        self.loops = []
+
+    def start(self):
+        logger.debug('Starting monitor scheduler for shard: {0}'.format(self.shard))
+
+        ensure_stats_template()
+
+        # Make sure the other shards are running too, ie after upgrading
+        Device.ensure_monitor_shards()
+        self.stop_legacy_monitors()
+
+        self.sync()
+
+        self.loops = [
+            gevent.spawn(self.run),
+            gevent.spawn(run_loop, self.sync, self.SYNC_INTERVAL),
+            gevent.spawn(run_loop, self.update_subscribers, self.SUBSCRIBER_INTERVAL),
+            gevent.spawn(run_loop, self.update_facts, self.FACTS_CHECK_INTERVAL)
+        ]
+
+        gevent.joinall(self.loops, raise_error=True)
+
+    def stop(self):
+        for loop in self.loops:
+            loop.kill()
+
+        self.pool.kill()
+        self.facts_pool.kill()
+
+        for device_id in self.monitors.keys():
+            self.remove_device(device_id)
+
+        # Get anything still buffered into ES before the worker goes away
+        stat_buffer.flush_all()
+
+    def sync(self):
+        '''
+        Syncs the running monitors with the shards Active, connected devices in the DB,
+        restarting any flagged for reload in the shards Redis set.
+        '''
+
+        reload_key = Device.get_monitor_reload_key(self.shard)
+
+        pipe = task_app.redis.pipeline()
+        pipe.smembers(reload_key)
+        pipe.delete(reload_key)
+        reload_ids, _ = pipe.execute()
+
+        reload_ids = set(int(device_id) for device_id in reload_ids)
+
+        with self.db_lock:
+            # Start a fresh transaction so we see changes since the last sync
+            db.session.close()
+
+            device_ids = set(
+                device_id
+                for device_id, in db.session.query(Device.id).filter(
+                    Device.status == 'Active',
+                    Device.ssh_connected.is_(True),
+                    Device.id % Device.MONITOR_SHARDS == self.shard
+                )
+            )
+
+            # Reloaded monitors hand their open rollups to their replacement
+            rollups = {}
+
+            # And their old (detached) instances, to disconnect if the SSH details change
+            old_devices = {}
+
+            for device_id in self.monitors.keys():
+                if device_id not in device_ids:
+                    self.remove_device(device_id, disconnect=True)
+                elif device_id in reload_ids:
+                    old_devices[device_id] = self.monitors[device_id].device
+                    rollups[device_id] = self.remove_device(device_id, flush=False)
+
+            # Refresh the instances, a reloaded device is still referenced by its old
+            # monitor (ie queued ticks) & would otherwise keep its old config/groups.
+            new_ids = device_ids - set(self.monitors.keys())
+            if new_ids:
+                for device in (
+                    Device.query.populate_existing()
+                    .filter(Device.id.in_(new_ids))
+                ):
+                    # Load now, as the session is closed on the next sync
+                    device.groups
+
+                    old_device = old_devices.get(device.id)
+                    if old_device and any(
+                        getattr(old_device, field) != getattr(device, field)
+                        for field in ('ssh_host', 'ssh_port', 'ssh_user')
+                    ):
+                        old_device.disconnect()
+
+                    self.add_device(device, rollups=rollups.get(device.id))
+
+            # Detach the (fully loaded) devices, so commits on the shared session (ie
+            # saving facts) can't expire them from under their monitors.
+            db.session.expunge_all()
+
+    def stop_legacy_monitors(self):
+        '''
+        Stops any per-device network/device_monitor tasks left over from before devices
+        were monitored by shard schedulers.
+        '''
+
+        with self.db_lock:
+            device_ids = [
+                device_id
+                for device_id, in db.session.query(Device.id).filter(
+                    Device.id % Device.MONITOR_SHARDS == self.shard
+                )
+            ]
+
+        for device_id in device_ids:
+            task_id = '{0}{1}'.format(Device.MONITOR_TASK_PREFIX, device_id)
+
+            if task_app.helpers.get_task(task_id):
+                logger.info('Stopping legacy device monitor task: {0}'.format(task_id))
+                task_app.helpers.stop_task(task_id)
+
+    def update_live_stats(self):
+        '''
+        Picks up live stats leases (see Device.request_live_stats). A lease only
+        applies while someone is subscribed to the devices stats, so page views that
+        go away don't keep the device sampling every second until it expires.
+        '''
+
+        monitors = self.monitors.values()
+        subscribed = [monitor for monitor in monitors if monitor.subscribed]
+
+        live_intervals = task_app.redis.mget([
+            monitor.device.live_stats_key
+            for monitor in subscribed
+        ]) if subscribed else []
+
+        live_intervals = dict(zip(subscribed, live_intervals))
+
+        for monitor in monitors:
+            live_interval = live_intervals.get(monitor)
+            live_interval = int(live_interval) if live_interval else None
+
+            if not monitor.set_live_interval(live_interval) or monitor.is_agent:
+                continue
+
+            # Lease started, tick now rather than waiting out the stat interval
+            if live_interval and monitor.next_tick_at > time() + live_interval:
+                self.schedule(monitor, time())
+
+    def update_subscribers(self):
+        '''
+        Flags which monitors have websocket subscribers to their stats & processes
+        channels, with a single PUBSUB NUMSUB for the whole shard, so idle devices
+        publish nothing & only sample processes while someone is watching.
+        '''
+
+        monitors = self.monitors.values()
+        if not monitors:
+            return
+
+        counts = task_app.redis.execute_command(
+            'PUBSUB', 'NUMSUB',
+            *(
+                [monitor.channel for monitor in monitors]
+                + [monitor.processes_channel for monitor in monitors]
+            )
+        )
+
+        # Reply is [channel, count, channel, count...] in the order requested
+        counts = counts[1::2]
+        processes_counts = counts[len(monitors):]
+
+        for monitor, count, processes_count in zip(monitors, counts, processes_counts):
+            monitor.subscribed = int(count) > 0
+            monitor.set_processes_subscribed(int(processes_count) > 0)
+
+        self.update_live_stats()
+
+    def update_facts(self):
+        '''
+        Collects facts from the devices due them, in parallel, then saves any changes
+        one device at a time (the greenlets share a DB session).
+        '''
+
+        now = time()
+        monitors = [
+            monitor for monitor in self.monitors.values()
+            if monitor.next_facts_at <= now
+        ]
+
+        if not monitors:
+            return
+
+        all_facts = self.facts_pool.map(lambda monitor: monitor.collect_facts(), monitors)
+
+        with self.db_lock:
+            for monitor, facts in zip(monitors, all_facts):
+                if facts:
+                    save_facts(monitor.device, facts)
+
+    def add_device(self, device, rollups=None):
+        if device.status != 'Active' or not device.ssh_connected:
+            return
+
+        monitor = DeviceMonitor(device, rollups=rollups)
+        self.monitors[device.id] = monitor
+
+        if monitor.is_agent:
+            monitor.start()
+        else:
+            self.schedule(monitor, monitor.get_next_tick(time()))
+
+    def remove_device(self, device_id, flush=True, disconnect=False):
+        '''
+        Stops & removes a devices monitor, returning its rollups if not flushed. Only
+        disconnect devices which are gone (removed/suspended), as the pooled connection
+        is shared by anything else on the same host.
+        '''
+
+        # Any queued ticks for the monitor are skipped in the run loop
+        monitor = self.monitors.pop(device_id, None)
+
+        if monitor:
+            monitor.stop(flush=flush)
+
+            if disconnect:
+                monitor.device.disconnect()
+
+            if not flush:
+                return monitor.rollups
+
+    def schedule(self, monitor, tick_at):
+        # Replaces any tick already queued for the monitor
+        monitor.next_tick_at = tick_at
+
+        heappush(self.queue, (tick_at, monitor.device.id, monitor))
+        self.queue_changed.set()
+
+    def run(self):
+        '''Spawns ticks as they come due, waiting for the next or a queue change.'''
+
+        while True:
+            now = time()
+
+            while self.queue and self.queue[0][0] <= now:
+                tick_at, device_id, monitor = heappop(self.queue)
+
+                # Removed/reloaded/rescheduled since queued
+                if (
+                    self.monitors.get(device_id) is not monitor
+                    or monitor.next_tick_at != tick_at
+                ):
+                    continue
+
+                # Blocks while the pool is full
+                self.pool.spawn(self.tick, monitor, tick_at)
+
+            self.queue_changed.clear()
+
+            timeout = self.queue[0][0] - time() if self.queue else None
+            self.queue_changed.wait(timeout)
+
+    def tick(self, monitor, tick_at):
+        try:
+            monitor.tick()
+
+        except Device.DeviceError as e:
+            logger.warning('Device monitor error on {0}: {1}'.format(
+                monitor.device, e
+            ))
+
+            # Don't rank the device on stats it's no longer reporting
+            remove_from_leaderboards(monitor.device.id)
+
+        # Schedule from the due time, not now, so slow ticks don't drift; if we've
+        # fallen behind skip to the next tick in phase rather than bunching up.
+        finally:
+            if (
+                self.monitors.get(monitor.device.id) is monitor
+                and monitor.next_tick_at == tick_at
+            ):
+                now = time()
+
+                if monitor.live_interval:
+                    next_tick_at = max(tick_at + monitor.live_interval, now)
+
+                # Back in phase after any live stats ticks
+                else:
+                    next_tick_at = monitor.get_next_tick(
+                        max(tick_at + monitor.interval / 2.0, now)
+                    )
+
+                self.schedule(monitor, next_tick_at)
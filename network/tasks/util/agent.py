@@ -0,0 +1,37 @@
+# oxy.io Network
+# File: network/tasks/util/agent.py
+# Desc: the remote collector agent script for streaming device monitors
+
+from .collect import FRAME_PREFIX, SAMPLE_END
+
+
+# Relative to the SSH users home directory (the SFTP & exec cwd)
+AGENT_PATH = '.oxyio-network-agent.sh'
+
+# Writes one framed sample every $1 seconds until the channel is closed, at which
+# point the echo fails (SIGPIPE) and the agent exits.
+AGENT_SCRIPT = '''#!/bin/sh
+# oxy.io Network collector agent
+
+INTERVAL=${{1:-10}}
+
+while true; do
+    echo "{prefix}cpu"; cat /proc/stat
+    echo "{prefix}memory"; cat /proc/meminfo
+    echo "{prefix}disk"; df -PB 1000
+    echo "{prefix}disk_io"; cat /proc/diskstats
+    echo "{prefix}network_io"; cat /proc/net/dev
+    echo "{prefix}{end}" || exit 1
+    sleep $INTERVAL
+done
+'''.format(prefix=FRAME_PREFIX, end=SAMPLE_END)
+
+
+def install_agent(device):
+    '''Uploads the collector agent script to a (connected) device.'''
+
+    device.put(AGENT_SCRIPT, AGENT_PATH)
+
+
+def make_agent_command(interval):
+    return 'sh {0} {1}'.format(AGENT_PATH, interval)
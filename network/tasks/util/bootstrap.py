@@ -0,0 +1,59 @@
+# oxy.io Network
+# File: network/tasks/util/bootstrap.py
+# Desc: connect to & prepare new devices for monitoring
+
+from oxyio import settings
+
+from .agent import install_agent
+
+
+class BootstrapError(Exception):
+    pass
+
+
+def bootstrap_device(device, password=None):
+    '''
+    Connects to a device, installs our SSH key & any collector agent, setting
+    device.ssh_connected (but not saving) either way. Raises BootstrapError on
+    failure.
+    '''
+
+    device.ssh_connected = False
+
+    # Try connecting, or fail/end w/error - bootstraps are user initiated (ie after
+    # fixing the SSH details), so don't wait out a backoff from earlier failures.
+    try:
+        device.connect(password=password, backoff=False)
+
+    except device.ConnectionError as e:
+        raise BootstrapError('Could not connect: {0}'.format(e))
+
+    public_key = open(settings.SSH_KEY_PUBLIC).read().strip()
+
+    try:
+        # Attempt to write SSH key (in a single round trip)
+        device.execute_multi(
+            # Setup .ssh and authorized_keys
+            'mkdir -p ~/.ssh',
+            'touch ~/.ssh/authorized_keys',
+            # Write the pubkey if not present
+            'cat ~/.ssh/authorized_keys | grep "{0}" || echo "{0}" >> ~/.ssh/authorized_keys'.format(public_key),
+            # Ensure permissions
+            'chmod 700 ~/.ssh',
+            'chmod 600 ~/.ssh/authorized_keys',
+        )
+
+    except device.DeviceError as e:
+        raise BootstrapError('Error adding key: {0}'.format(e))
+
+    # Upload the collector agent up front, so an Agent mode device fails to connect
+    # rather than to monitor (the monitor reinstalls it, ie after a mode change).
+    # Checking the remote copy may also run commands.
+    if device.stat_mode == 'Agent':
+        try:
+            install_agent(device)
+
+        except device.DeviceError as e:
+            raise BootstrapError('Error uploading agent: {0}'.format(e))
+
+    device.ssh_connected = True
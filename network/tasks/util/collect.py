@@ -0,0 +1,63 @@
+# oxy.io Network
+# File: network/tasks/util/collect.py
+# Desc: build & split framed multi-collector commands
+
+# Marks the start of each collectors output in a framed stream
+FRAME_PREFIX = '@@oxyio-network:'
+
+# Frame type marking the end of a sample in continuous streams
+SAMPLE_END = 'end'
+
+
+def make_framed_command(collectors):
+    '''
+    Builds a single shell command from (type, command) pairs which frames each
+    commands output with a marker line.
+    '''
+
+    return '; '.join(
+        'echo {0}{1}; {2}'.format(FRAME_PREFIX, type_, command)
+        for type_, command in collectors
+    )
+
+
+def split_framed_output(output):
+    '''Splits raw framed output into a dict of type -> output.'''
+
+    outputs = {}
+
+    # Anything before the first frame (motd, etc) is ignored
+    for frame in output.split(FRAME_PREFIX)[1:]:
+        type_, _, data = frame.partition('\n')
+        outputs[type_.strip()] = data
+
+    return outputs
+
+
+def iter_framed_samples(lines):
+    '''
+    Groups a continuous framed stream of lines (ie from the collector agent) into a
+    dict of type -> output per sample, yielding each as its end frame arrives.
+    '''
+
+    outputs = {}
+    current = None
+
+    for line in lines:
+        if line.startswith(FRAME_PREFIX):
+            type_ = line[len(FRAME_PREFIX):].strip()
+
+            if type_ == SAMPLE_END:
+                yield {
+                    frame_type: ''.join(frame_lines)
+                    for frame_type, frame_lines in outputs.iteritems()
+                }
+
+                outputs = {}
+                current = None
+
+            else:
+                current = outputs[type_] = []
+
+        elif current is not None:
+            current.append(line)
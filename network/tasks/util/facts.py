@@ -0,0 +1,111 @@
+# oxy.io Network
+# File: network/tasks/util/facts.py
+# Desc: collect device facts & store the ones which changed
+
+import json
+from hashlib import sha1
+
+from oxyio.app import db
+
+from ...models.device import DeviceFact
+from .collect import make_framed_command, split_framed_output
+from .parse_facts import (
+    parse_os_facts, parse_kernel_facts, parse_cpu_facts, parse_memory_facts,
+    parse_nic_facts, parse_disk_facts, parse_package_facts
+)
+
+
+# (key, command, parser) for every fact group
+FACTS = (
+    ('os', 'cat /etc/os-release 2>/dev/null', parse_os_facts),
+    ('kernel', 'uname -srm', parse_kernel_facts),
+    ('cpu', "grep '^model name' /proc/cpuinfo", parse_cpu_facts),
+    ('memory', 'grep Total: /proc/meminfo', parse_memory_facts),
+    ('nics', 'ip -o link 2>/dev/null; ip -o addr 2>/dev/null', parse_nic_facts),
+    ('disks', 'cat /proc/partitions', parse_disk_facts),
+    # Last, so it sets the exit status: always 0 so hosts without either (ie Alpine,
+    # Arch) still save their other facts.
+    (
+        'packages', 'dpkg -l 2>/dev/null || rpm -qa 2>/dev/null || true',
+        parse_package_facts
+    )
+)
+
+FACTS_COMMAND = make_framed_command((key, command) for key, command, _ in FACTS)
+
+# Cap on the output of a collection (package lists can be long)
+MAX_OUTPUT = 16 * 1024 * 1024
+
+
+def collect_facts(device, timeout=None):
+    '''
+    Collects every fact group from a (connected) device with a single framed
+    command, returning {key: facts}.
+    '''
+
+    output = device.execute(
+        FACTS_COMMAND,
+        raw=True, timeout=timeout, max_output=MAX_OUTPUT
+    )
+    outputs = split_framed_output(output)
+
+    return {
+        key: parser(outputs.get(key, ''))
+        for key, _, parser in FACTS
+    }
+
+
+def hash_facts(facts):
+    return sha1(json.dumps(facts, sort_keys=True)).hexdigest()
+
+
+def save_facts(device, facts):
+    '''
+    Writes the fact groups whose content hash has changed since last stored, in one
+    bulk insert & update. Returns the keys written.
+    '''
+
+    existing = {
+        key: (fact_id, hash_)
+        for fact_id, key, hash_ in db.session.query(
+            DeviceFact.id, DeviceFact.key, DeviceFact.hash
+        ).filter(DeviceFact.device_id == device.id)
+    }
+
+    inserts = []
+    updates = []
+
+    for key, value in facts.iteritems():
+        # Nothing collected (ie command missing), keep what we had
+        if not value:
+            continue
+
+        hash_ = hash_facts(value)
+        fact_id, existing_hash = existing.get(key, (None, None))
+
+        if hash_ == existing_hash:
+            continue
+
+        fact = {
+            'key': key,
+            'value': json.dumps(value, sort_keys=True),
+            'hash': hash_
+        }
+
+        if fact_id is None:
+            fact['device_id'] = device.id
+            inserts.append(fact)
+        else:
+            fact['id'] = fact_id
+            updates.append(fact)
+
+    if inserts:
+        db.session.bulk_insert_mappings(DeviceFact, inserts)
+
+    if updates:
+        db.session.bulk_update_mappings(DeviceFact, updates)
+
+    if inserts or updates:
+        db.session.commit()
+
+    return [fact['key'] for fact in inserts + updates]
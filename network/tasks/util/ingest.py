@@ -0,0 +1,201 @@
+# oxy.io Network
+# File: network/tasks/util/ingest.py
+# Desc: per-worker buffer bulk indexing stat documents into Elasticsearch
+
+from datetime import datetime
+from time import time
+
+import gevent
+from gevent.event import Event
+from elasticsearch.helpers import bulk, BulkIndexError
+
+from oxyio import settings
+from oxyio.app import es_client
+from oxyio.log import logger
+
+from ...stats import ROLLUP_RESOLUTIONS, get_raw_stats_index, get_rollup_index
+
+
+# Applies to the raw & rollup stats indexes (all created after it)
+STATS_TEMPLATE = {
+    'template': '{0}*'.format(settings.ES_STATS_INDEX),
+    'mappings': {
+        'stats': {
+            '_all': {'enabled': False},
+            'properties': {
+                'object_module': {'type': 'string', 'index': 'not_analyzed'},
+                'object_type': {'type': 'string', 'index': 'not_analyzed'},
+                'object_id': {'type': 'integer'},
+                'group_ids': {'type': 'integer'},
+                'datetime': {'type': 'date'},
+                'type': {'type': 'string', 'index': 'not_analyzed'},
+                'key': {'type': 'string', 'index': 'not_analyzed'}
+            },
+            # Detail columns are numbers, any other strings are exact values
+            'dynamic_templates': [{
+                'strings': {
+                    'match_mapping_type': 'string',
+                    'mapping': {'type': 'string', 'index': 'not_analyzed'}
+                }
+            }]
+        }
+    }
+}
+
+
+def ensure_stats_template():
+    es_client.indices.put_template(name='network-stats', body=STATS_TEMPLATE)
+
+    # Create the indexes up front (400 = exists), so stats views can query them
+    # before anything's been written.
+    for index in [get_raw_stats_index()] + [
+        get_rollup_index(resolution)
+        for resolution, _ in ROLLUP_RESOLUTIONS
+    ]:
+        es_client.indices.create(index=index, ignore=400)
+
+
+def make_stats_documents(obj, type_, stats, when=None, index=None, group_ids=None):
+    '''
+    Build bulk actions indexing one ticks stats of a type for an object, one flat
+    document per key with a column per detail. Documents are tagged with any
+    group_ids so group stats can be filtered on a single term.
+    '''
+
+    module, object_type = obj.NAME.split('/', 1)
+    when = when or datetime.utcnow()
+    index = index or get_raw_stats_index()
+
+    documents = []
+
+    for key, details in stats.iteritems():
+        source = {
+            'object_module': module,
+            'object_type': object_type,
+            'object_id': obj.id,
+            'datetime': when,
+            'type': type_,
+            'key': key
+        }
+
+        if group_ids:
+            source['group_ids'] = group_ids
+
+        source.update(details)
+
+        documents.append({
+            '_index': index,
+            '_type': 'stats',
+            '_source': source
+        })
+
+    return documents
+
+
+class StatBuffer(object):
+    '''
+    Buffers stat documents from every monitor in the worker, bulk indexing them once
+    MAX_DOCUMENTS are waiting or the oldest is MAX_AGE seconds old. When ES falls
+    behind, documents build up to MAX_BUFFERED, after which add blocks the caller
+    (and so slows collection) until a flush gets through, or drops the document for
+    callers which mustn't block.
+    '''
+
+    MAX_DOCUMENTS = 1000
+    MAX_AGE = 5
+    MAX_BUFFERED = 20000
+
+    # Seconds to wait before retrying a failed bulk request
+    RETRY_INTERVAL = 5
+
+    def __init__(self):
+        self.documents = []
+        self.oldest = None
+
+        self.ready = Event()
+        self.flushed = Event()
+
+        self.flusher = None
+
+    def add(self, document, block=True):
+        '''Buffer a document, returns False if it was dropped (full & not block).'''
+
+        while len(self.documents) >= self.MAX_BUFFERED:
+            if not block:
+                return False
+
+            self.flushed.wait()
+
+        if not self.documents:
+            self.oldest = time()
+
+        self.documents.append(document)
+
+        if len(self.documents) >= self.MAX_DOCUMENTS:
+            self.ready.set()
+
+        if not self.flusher:
+            self.flusher = gevent.spawn(self.run)
+
+        return True
+
+    def run(self):
+        while True:
+            if self.documents:
+                timeout = max(0, self.oldest + self.MAX_AGE - time())
+            else:
+                timeout = None
+
+            self.ready.wait(timeout)
+            self.ready.clear()
+
+            if not self.documents:
+                continue
+
+            if not self.flush():
+                gevent.sleep(self.RETRY_INTERVAL)
+
+    def flush(self):
+        '''Bulk index up to MAX_DOCUMENTS, returns False if ES could not be reached.'''
+
+        documents = self.documents[:self.MAX_DOCUMENTS]
+        self.documents = self.documents[self.MAX_DOCUMENTS:]
+
+        # Anything left over is due now
+        self.oldest = time() - self.MAX_AGE if self.documents else None
+
+        try:
+            bulk(es_client, documents)
+
+        # Documents ES rejected won't get any better, drop them
+        except BulkIndexError as e:
+            logger.warning('Dropped {0} stat documents rejected by ES: {1}'.format(
+                len(e.errors), e.errors[:1]
+            ))
+
+        except Exception as e:
+            logger.warning('Failed to bulk index {0} stat documents: {1}'.format(
+                len(documents), e
+            ))
+
+            # Requeue at the front, ahead of anything added since
+            self.documents = documents + self.documents
+            self.oldest = time() - self.MAX_AGE
+            return False
+
+        # Wake anything blocked in add, swapping in a fresh event for the next flush
+        finally:
+            flushed, self.flushed = self.flushed, Event()
+            flushed.set()
+
+        return True
+
+    def flush_all(self):
+        '''Flush everything (ie on shutdown), giving up on the first failure.'''
+
+        while self.documents and self.flush():
+            pass
+
+
+# Shared by all the monitors in a worker
+stat_buffer = StatBuffer()
@@ -0,0 +1,144 @@
+# oxy.io Network
+# File: network/tasks/util/parse_facts.py
+# Desc: parse facts for the device fact collector
+
+# Like the stat parsers, these take raw command output (a single string)
+
+MEMORY_KEYS = {
+    'MemTotal': 'memory',
+    'SwapTotal': 'swap'
+}
+
+# Block devices which aren't disks
+IGNORE_DISKS = ('loop', 'ram')
+
+
+def parse_os_facts(facts):
+    '''Parses /etc/os-release output.'''
+
+    details = {}
+
+    for line in facts.splitlines():
+        key, equals, value = line.partition('=')
+
+        if equals and key in ('NAME', 'PRETTY_NAME', 'ID', 'VERSION_ID'):
+            details[key.lower()] = value.strip().strip('"\'')
+
+    return details
+
+
+def parse_kernel_facts(facts):
+    '''Parses uname -srm output.'''
+
+    bits = facts.split()
+    if len(bits) < 3:
+        return {}
+
+    return {
+        'name': bits[0],
+        'release': bits[1],
+        'machine': bits[2]
+    }
+
+
+def parse_cpu_facts(facts):
+    '''Parses the model name lines of /proc/cpuinfo.'''
+
+    models = [
+        line.partition(':')[2].strip()
+        for line in facts.splitlines()
+        if line.startswith('model name')
+    ]
+
+    if not models:
+        return {}
+
+    return {
+        'model': models[0],
+        'count': len(models)
+    }
+
+
+def parse_memory_facts(facts):
+    '''Parses the total lines of /proc/meminfo (kB).'''
+
+    details = {}
+
+    for line in facts.splitlines():
+        key, _, value = line.partition(':')
+
+        if key in MEMORY_KEYS:
+            details[MEMORY_KEYS[key]] = int(value.split(None, 1)[0])
+
+    return details
+
+
+def parse_nic_facts(facts):
+    '''Parses ip -o link & ip -o addr output.'''
+
+    nics = {}
+
+    for line in facts.splitlines():
+        bits = line.split()
+        if len(bits) < 4:
+            continue
+
+        # Drop the trailing colon & any @parent (ie VLANs)
+        name = bits[1].rstrip(':').partition('@')[0]
+        nic = nics.setdefault(name, {'addresses': []})
+
+        if bits[2] in ('inet', 'inet6'):
+            nic['addresses'].append(bits[3])
+            continue
+
+        for i, bit in enumerate(bits[:-1]):
+            if bit == 'mtu':
+                nic['mtu'] = int(bits[i + 1])
+            elif bit.startswith('link/'):
+                nic['mac'] = bits[i + 1]
+
+    return nics
+
+
+def parse_disk_facts(facts):
+    '''Parses /proc/partitions output (sizes in kB).'''
+
+    disks = {}
+
+    # Skip the header line
+    for line in facts.splitlines()[1:]:
+        bits = line.split()
+        if len(bits) != 4:
+            continue
+
+        name = bits[3]
+
+        if name.startswith(IGNORE_DISKS):
+            continue
+
+        disks[name] = int(bits[2])
+
+    return disks
+
+
+def parse_package_facts(facts):
+    '''Parses dpkg -l (ii lines) or rpm -qa output into package -> version.'''
+
+    packages = {}
+
+    for line in facts.splitlines():
+        bits = line.split()
+
+        if not bits:
+            continue
+
+        # dpkg: status, name, version, arch, description
+        if bits[0] == 'ii' and len(bits) >= 3:
+            packages[bits[1]] = bits[2]
+
+        # rpm: name-version-release
+        elif len(bits) == 1 and bits[0].count('-') >= 2:
+            name, version, release = bits[0].rsplit('-', 2)
+            packages[name] = '{0}-{1}'.format(version, release)
+
+    return packages
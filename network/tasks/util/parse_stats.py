@@ -4,93 +4,144 @@
 
 from __future__ import division
 
-import re
+from itertools import imap, izip
+
+# The parsers below take raw command output (a single string), skip unwanted lines
+# before splitting them and zip the wanted fields straight into the result dicts.
+
+CPU_COLUMNS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'soft_irq')
+
+MEMORY_KEYS = {
+    'MemTotal': ('memory', 'total'),
+    'MemFree': ('memory', 'free'),
+    'Buffers': ('memory', 'buffers'),
+    'Cached': ('memory', 'cached'),
+    'SwapTotal': ('swap', 'total'),
+    'SwapFree': ('swap', 'free'),
+    'SwapCached': ('swap', 'cached')
+}
+
+DISK_COLUMNS = ('blocks', 'used', 'available')
+
+DISK_IO_COLUMNS = (
+    'reads', 'read_merges', 'read_sectors', 'read_time',
+    'writes', 'write_merges', 'write_sectors', 'write_time',
+    'current_ios', 'io_time'
+)
+
+NETWORK_IO_COLUMNS = (
+    'receive_bytes', 'receive_packets', 'receive_errors', 'receive_drop',
+    'transmit_bytes', 'transmit_packets', 'transmit_errors', 'transmit_drop'
+)
+
+# Field indexes (after the interface name) of the above in /proc/net/dev
+NETWORK_IO_FIELDS = (0, 1, 2, 3, 8, 9, 10, 11)
 
 
 def parse_cpu_stats(stats):
-    '''Parses 2x /proc/stat output to calculate CPU %.'''
+    '''Parses a /proc/stat snapshot into CPU times (see calculate_cpu_percentages).'''
 
-    columns = ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'soft_irq']
     cpus = {}
+
+    for line in stats.splitlines():
+        if not line.startswith('cpu'):
+            # The cpu lines come first, everything after (intr, etc) is ignored
+            if cpus:
+                break
+
+            continue
+
+        bits = line.split(None, 8)
+        cpus[bits[0]] = dict(izip(CPU_COLUMNS, imap(int, bits[1:8])))
+
+    return cpus
+
+
+def calculate_cpu_percentages(previous, current):
+    '''Calculates CPU % from two parse_cpu_stats snapshots.'''
+
     cpu_percentages = {}
 
-    for line in stats:
-        bits = line.split()
-        key, details = bits[0], [int(bit) for bit in bits[1:8]]
+    for key, details in current.iteritems():
+        if key not in previous:
+            continue
 
-        if key.startswith('cpu'):
-            if key in cpus:
-                # Calculate usage (second cat)
-                diffs = [details[i] - cpus[key][i] for i, _ in enumerate(columns)]
-                total = sum(diffs)
+        diffs = {
+            column: value - previous[key][column]
+            for column, value in details.iteritems()
+        }
+        total = sum(diffs.itervalues())
 
-                percentages = {
-                    column: round(diffs[i] / total * 100, 3)
-                    for i, column in enumerate(columns)
-                    if column != 'idle'
-                }
-                cpu_percentages[key] = percentages
+        # No time passed (or counters reset), nothing to calculate
+        if total <= 0:
+            continue
 
-            else:
-                # Set details (first cat)
-                cpus[key] = details
+        cpu_percentages[key] = {
+            column: round(diff / total * 100, 3)
+            for column, diff in diffs.iteritems()
+            if column != 'idle'
+        }
 
     return cpu_percentages
 
 
+def calculate_differences(previous, current):
+    '''Calculates the change in total stats (ie bytes sent) between two ticks.'''
+
+    return {
+        key: {
+            detail: value - previous[key][detail]
+            for detail, value in details.iteritems()
+        }
+        for key, details in current.iteritems()
+        if key in previous
+    }
+
+
 def parse_memory_stats(stats):
     '''Parses /proc/meminfo output.'''
 
-    memory_details = {}
-    swap_details = {}
-
-    key_map = {
-        'MemTotal:': (memory_details, 'total'),
-        'MemFree:': (memory_details, 'free'),
-        'Buffers:': (memory_details, 'buffers'),
-        'Cached:': (memory_details, 'cached'),
-        'SwapTotal:': (swap_details, 'total'),
-        'SwapFree:': (swap_details, 'free'),
-        'SwapCached:': (swap_details, 'cached')
+    details = {
+        'memory': {},
+        'swap': {}
     }
+    remaining = len(MEMORY_KEYS)
 
-    for line in stats:
-        bits = line.split()
-        key, value = bits[:2]
+    for line in stats.splitlines():
+        key, _, value = line.partition(':')
 
-        if key in key_map:
-            key = key.strip('')
-            type_, stat = key_map[key]
-            type_[stat] = int(value)
+        if key in MEMORY_KEYS:
+            type_, stat = MEMORY_KEYS[key]
+            details[type_][stat] = int(value.split(None, 1)[0])
 
-    return {
-        'memory': memory_details,
-        'swap': swap_details
-    }
+            remaining -= 1
+            if not remaining:
+                break
+
+    return details
 
 
 def parse_disk_stats(stats):
     '''Parses df output.'''
 
-    columns = ['blocks', 'used', 'available']
     disks = {}
 
-    for line in stats:
-        bits = line.split()
-        type_, key, details = bits[0], bits[5], bits[1:4]
+    # Skip the header line
+    for line in stats.splitlines()[1:]:
+        if line.startswith('none'):
+            continue
 
-        if type_ in ['Filesystem', 'none']:
+        # Mount points may contain spaces
+        bits = line.split(None, 5)
+        if len(bits) < 6:
             continue
 
+        key = bits[5]
+
         if key.startswith('/dev') or key.startswith('/run'):
             continue
 
-        disk = {
-            column: int(details[i])
-            for i, column in enumerate(columns)
-        }
-
-        disks[key] = disk
+        disks[key] = dict(izip(DISK_COLUMNS, imap(int, bits[1:4])))
 
     return disks
 
@@ -98,27 +149,20 @@ def parse_disk_stats(stats):
 def parse_disk_io_stats(stats):
     '''Parses /proc/diskstats output.'''
 
-    columns = [
-        'reads', 'read_merges', 'read_sectors', 'read_time',
-        'writes', 'write_merges', 'write_sectors', 'write_time',
-        'current_ios', 'io_time'
-    ]
-
     disk_stats = {}
 
-    for line in stats:
+    for line in stats.splitlines():
         bits = line.split()
-        key, details = bits[2], [int(bit) for bit in bits[3:]]
+        if len(bits) < 13:
+            continue
+
+        key = bits[2]
 
         if key.startswith('loop') or key.startswith('ram'):
             continue
 
-        stats = {
-            column: details[i - 1]
-            for i, column in enumerate(columns)
-        }
-
-        disk_stats[key] = stats
+        # Newer kernels append discard/flush fields, which we ignore
+        disk_stats[key] = dict(izip(DISK_IO_COLUMNS, imap(int, bits[3:13])))
 
     return disk_stats
 
@@ -126,28 +170,20 @@ def parse_disk_io_stats(stats):
 def parse_network_io_stats(stats):
     '''Parses /proc/net/dev output.'''
 
-    columns = ['bytes', 'packets', 'errors', 'drop']
-    match_device = r'^\s*([a-z0-9A-Z]+):\s+'
-
     device_stats = {}
 
-    for line in stats:
-        matches = re.match(match_device, line)
-        if matches:
-            key, bits = matches.group(1), line.split()
-            details_receive = [int(bit) for bit in bits[1:5]]
-            details_transmit = [int(bit) for bit in bits[9:13]]
-
-            stats = {
-                'receive_{0}'.format(column): details_receive[i]
-                for i, column in enumerate(columns)
-            }
+    for line in stats.splitlines():
+        # The two header lines have no colon
+        key, colon, data = line.partition(':')
+        if not colon:
+            continue
 
-            stats.update({
-                'transmit_{0}'.format(column): details_transmit[i]
-                for i, column in enumerate(columns)
-            })
+        # Large counters can run into the colon, so split the data separately
+        bits = data.split()
 
-            device_stats[key] = stats
+        device_stats[key.strip()] = {
+            column: int(bits[i])
+            for column, i in izip(NETWORK_IO_COLUMNS, NETWORK_IO_FIELDS)
+        }
 
     return device_stats
@@ -0,0 +1,136 @@
+# oxy.io Network
+# File: network/tasks/util/processes.py
+# Desc: the remote process sampler script for the device processes tab
+
+from .collect import FRAME_PREFIX, SAMPLE_END
+
+
+# Relative to the SSH users home directory (the SFTP & exec cwd)
+PROCESSES_PATH = '.oxyio-network-processes.sh'
+
+# Samples every /proc/[pid]/stat every $1 seconds & writes only the top $2 processes
+# by CPU (since the last sample) and by memory, as lines of:
+#   <cpu|memory> <pid> <cpu %> <memory %> <rss kB> <name>
+# followed by an end frame. Like the agent it exits (SIGPIPE) once the channel closes.
+PROCESSES_SCRIPT = r'''#!/bin/sh
+# oxy.io Network process sampler
+
+INTERVAL=${1:-2}
+COUNT=${2:-10}
+PAGE_SIZE=$(getconf PAGESIZE 2>/dev/null || echo 4096)
+MEM_TOTAL=$(awk '/^MemTotal:/ {print $2}' /proc/meminfo)
+
+while true; do
+    head -n 1 /proc/stat
+    cat /proc/[0-9]*/stat 2>/dev/null
+    echo "END_FRAME"
+    sleep $INTERVAL
+done | awk \
+    -v count="$COUNT" -v page_size="$PAGE_SIZE" -v mem_total="$MEM_TOTAL" \
+    -v end_frame="END_FRAME" '
+
+function print_top(values, type,    i, pid, best, seen) {
+    for (i = 0; i < count; i++) {
+        best = ""
+
+        for (pid in values) {
+            if (!(pid in seen) && (best == "" || values[pid] > values[best]))
+                best = pid
+        }
+
+        if (best == "")
+            break
+
+        seen[best] = 1
+        printf "%s %s %.2f %.2f %d %s\n", type, best, cpu[best], \
+            rss[best] / mem_total * 100, rss[best], names[best]
+    }
+}
+
+# Total jiffies of all CPUs
+/^cpu / {
+    total = 0
+    for (i = 2; i <= NF; i++)
+        total += $i
+    next
+}
+
+$0 == end_frame {
+    total_delta = total - previous_total
+
+    # The first sample is only a baseline
+    if (previous_total && total_delta > 0) {
+        for (pid in times) {
+            cpu[pid] = 0
+
+            if (pid in previous_times)
+                cpu[pid] = (times[pid] - previous_times[pid]) / total_delta * 100
+        }
+
+        print_top(cpu, "cpu")
+        print_top(rss, "memory")
+        print end_frame
+        fflush()
+    }
+
+    delete previous_times
+    for (pid in times)
+        previous_times[pid] = times[pid]
+    previous_total = total
+
+    delete times
+    delete rss
+    delete names
+    delete cpu
+    next
+}
+
+# pid (name) state ..., the name may contain spaces & parentheses
+{
+    rest = $0
+    sub(/^.*\) /, "", rest)
+
+    open = index($0, "(")
+    names[$1] = substr($0, open + 1, length($0) - length(rest) - open - 2)
+
+    split(rest, fields, " ")
+    times[$1] = fields[12] + fields[13]
+    rss[$1] = fields[22] * page_size / 1024
+}
+'
+'''.replace('END_FRAME', '{0}{1}'.format(FRAME_PREFIX, SAMPLE_END))
+
+PROCESS_FIELDS = ('pid', 'cpu', 'memory', 'rss', 'name')
+
+
+def install_processes(device):
+    '''Uploads the process sampler script to a (connected) device.'''
+
+    device.put(PROCESSES_SCRIPT, PROCESSES_PATH)
+
+
+def make_processes_command(interval, count):
+    return 'sh {0} {1} {2}'.format(PROCESSES_PATH, interval, count)
+
+
+def iter_process_samples(lines):
+    '''
+    Groups the process sampler output into {'cpu': [process], 'memory': [process]}
+    per sample, yielding each as its end frame arrives.
+    '''
+
+    sample = {'cpu': [], 'memory': []}
+
+    for line in lines:
+        if line.startswith(FRAME_PREFIX):
+            yield sample
+            sample = {'cpu': [], 'memory': []}
+            continue
+
+        bits = line.rstrip('\n').split(' ', 5)
+        if len(bits) != 6 or bits[0] not in sample:
+            continue
+
+        sample[bits[0]].append(dict(zip(PROCESS_FIELDS, (
+            int(bits[1]), float(bits[2]), float(bits[3]), int(bits[4]), bits[5]
+        ))))
@@ -0,0 +1,64 @@
+# oxy.io Network
+# File: network/tasks/util/push.py
+# Desc: push one file to many devices at once
+
+from shutil import copyfileobj
+from tempfile import NamedTemporaryFile
+
+from gevent.pool import Pool
+
+
+DEFAULT_CONCURRENCY = 20
+
+
+def _push(device, data, filename, destination):
+    try:
+        device.connect()
+
+        # Each device reads its own handle of the shared copy
+        if filename:
+            with open(filename, 'rb') as f:
+                uploaded = device.put(f, destination)
+        else:
+            uploaded = device.put(data, destination)
+
+    except device.DeviceError as e:
+        return device.id, False, str(e) or e.__class__.__name__
+
+    return device.id, uploaded, None
+
+
+def push_file(devices, data, destination, concurrency=None):
+    '''
+    Upload data (as Device.put) to destination on many devices, concurrency at a time,
+    skipping devices where the file is unchanged. Returns a list of
+    (device_id, uploaded, error) tuples.
+    '''
+
+    filename = None
+
+    # Files/iterators can only be read once, so copy them to disk for the devices to
+    # read in parallel.
+    if not isinstance(data, basestring):
+        copy = NamedTemporaryFile()
+
+        if hasattr(data, 'read'):
+            copyfileobj(data, copy)
+        else:
+            for chunk in data:
+                copy.write(chunk)
+
+        copy.flush()
+        filename = copy.name
+
+    try:
+        pool = Pool(concurrency or DEFAULT_CONCURRENCY)
+
+        return pool.map(
+            lambda device: _push(device, data, filename, destination),
+            devices
+        )
+
+    finally:
+        if filename:
+            copy.close()
@@ -0,0 +1,202 @@
+# oxy.io Network
+# File: network/tasks/util/rollup.py
+# Desc: per-device stat rollups maintained at ingest
+
+from __future__ import division
+
+from datetime import datetime
+
+from oxyio.app import es_client
+from oxyio.log import logger
+
+from ...stats import (
+    ROLLUP_RESOLUTIONS, TOTAL_STAT_TYPES,
+    get_rollup_index, get_object_filters
+)
+from .ingest import make_stats_documents
+
+
+# Rollup columns stored per detail, the detail column itself holding the sum/avg
+ROLLUP_SUFFIXES = ('_min', '_max', '_avg', '_last', '_count')
+
+
+class StatRollups(object):
+    '''
+    Keeps running min/max/avg/last rollups of one objects indexed stats for every
+    ROLLUP_RESOLUTIONS bucket. Each detail column holds the avg (or, for total stats,
+    the sum) so rollup documents can be queried exactly like the raw ones.
+
+    Documents have fixed IDs per object/type/key/bucket, so the open hour/day buckets
+    are rewritten each time a minute closes. Open buckets are seeded from the stored
+    documents on the first add, so a restarted monitor carries on rather than
+    overwriting them.
+    '''
+
+    # Max documents read per resolution when seeding
+    SEED_SIZE = 10000
+
+    def __init__(self, obj, group_ids=None):
+        self.obj = obj
+        self.group_ids = group_ids
+        self.seeded = False
+
+        # resolution -> (bucket start, {type: {key: {detail: rollup}}}) where each
+        # rollup is [min, max, sum, count, last].
+        self.buckets = {}
+
+    def add(self, tick_stats, now):
+        '''Add a ticks stats, returning documents for any buckets closed/updated.'''
+
+        if not self.seeded:
+            self.seed(now)
+
+        documents = []
+        minute_closed = False
+
+        for resolution, seconds in ROLLUP_RESOLUTIONS:
+            start = int(now - now % seconds)
+            bucket = self.buckets.get(resolution)
+
+            if bucket and bucket[0] != start:
+                documents.extend(self._make_documents(resolution, bucket))
+                bucket = None
+
+                if resolution == 'minute':
+                    minute_closed = True
+
+            # Still open, but bring the stored rollup up to date
+            elif bucket and minute_closed:
+                documents.extend(self._make_documents(resolution, bucket))
+
+            if not bucket:
+                bucket = self.buckets[resolution] = (start, {})
+
+            self._add_stats(bucket[1], tick_stats)
+
+        return documents
+
+    def seed(self, now):
+        '''Load the open buckets (if any) from the stored rollup documents.'''
+
+        self.seeded = True
+
+        for resolution, seconds in ROLLUP_RESOLUTIONS:
+            start = int(now - now % seconds)
+
+            try:
+                result = es_client.search(
+                    index=get_rollup_index(resolution),
+                    body={
+                        'query': {'bool': {'filter': get_object_filters(self.obj) + [
+                            {'range': {'datetime': {
+                                'gte': start * 1000,
+                                'lte': start * 1000,
+                                'format': 'epoch_millis'
+                            }}}
+                        ]}},
+                        'size': self.SEED_SIZE
+                    },
+                    ignore_unavailable=True
+                )
+
+            except Exception as e:
+                logger.warning('Could not seed {0} rollups for {1}: {2}'.format(
+                    resolution, self.obj, e
+                ))
+                continue
+
+            rollups = {}
+
+            for hit in result['hits']['hits']:
+                source = hit['_source']
+                key_rollups = rollups.setdefault(source['type'], {}).setdefault(
+                    source['key'], {}
+                )
+
+                for field, count in source.iteritems():
+                    if not field.endswith('_count'):
+                        continue
+
+                    detail = field[:-len('_count')]
+                    min_, max_, avg, last = (
+                        source.get('{0}{1}'.format(detail, suffix))
+                        for suffix in ROLLUP_SUFFIXES[:4]
+                    )
+
+                    if None in (min_, max_, avg, last) or not count:
+                        continue
+
+                    key_rollups[detail] = [min_, max_, avg * count, count, last]
+
+            if rollups:
+                self.buckets[resolution] = (start, rollups)
+
+    def flush(self):
+        '''Get documents for all the open buckets (ie when the monitor stops).'''
+
+        documents = []
+
+        for resolution, bucket in self.buckets.iteritems():
+            documents.extend(self._make_documents(resolution, bucket))
+
+        self.buckets = {}
+        return documents
+
+    def _add_stats(self, rollups, tick_stats):
+        for type_, stats in tick_stats.iteritems():
+            type_rollups = rollups.setdefault(type_, {})
+
+            for key, details in stats.iteritems():
+                key_rollups = type_rollups.setdefault(key, {})
+
+                for detail, value in details.iteritems():
+                    rollup = key_rollups.get(detail)
+
+                    if rollup is None:
+                        key_rollups[detail] = [value, value, value, 1, value]
+                        continue
+
+                    if value < rollup[0]:
+                        rollup[0] = value
+                    if value > rollup[1]:
+                        rollup[1] = value
+
+                    rollup[2] += value
+                    rollup[3] += 1
+                    rollup[4] = value
+
+    def _make_documents(self, resolution, bucket):
+        start, rollups = bucket
+
+        when = datetime.utcfromtimestamp(start)
+        index = get_rollup_index(resolution)
+
+        documents = []
+
+        for type_, type_rollups in rollups.iteritems():
+            is_total = type_ in TOTAL_STAT_TYPES
+            stats = {}
+
+            for key, key_rollups in type_rollups.iteritems():
+                details = stats[key] = {}
+
+                for detail, (min_, max_, sum_, count, last) in key_rollups.iteritems():
+                    avg = sum_ / count
+
+                    details[detail] = sum_ if is_total else avg
+                    details['{0}_min'.format(detail)] = min_
+                    details['{0}_max'.format(detail)] = max_
+                    details['{0}_avg'.format(detail)] = avg
+                    details['{0}_last'.format(detail)] = last
+                    details['{0}_count'.format(detail)] = count
+
+            for document in make_stats_documents(
+                self.obj, type_, stats,
+                when=when, index=index, group_ids=self.group_ids
+            ):
+                document['_id'] = '{0}-{1}-{2}-{3}'.format(
+                    self.obj.id, type_, document['_source']['key'], start
+                )
+                documents.append(document)
+
+        return documents
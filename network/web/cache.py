@@ -0,0 +1,185 @@
+# oxy.io Network
+# File: network/web/cache.py
+# Desc: time-bucketed cache in front of the stats queries
+
+from __future__ import division
+
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+from ..stats import (
+    DEFAULT_RANGE,
+    get_stats, get_interval, get_max_points, downsample
+)
+from ..tasks.util.ingest import StatBuffer
+
+
+class StatsCache(object):
+    '''
+    LRU cache of stats query results with per-entry TTLs. Misses on the same key are
+    serialized, so identical concurrent requests make a single ES query.
+    '''
+
+    MAX_ENTRIES = 10000
+
+    # Striped locks, so we don't keep a lock per key
+    LOCKS = 64
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self._locks = [Lock() for _ in xrange(self.LOCKS)]
+
+    @property
+    def info(self):
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def _get(self, key):
+        entry = self.entries.pop(key, None)
+
+        if entry and entry[0] > time():
+            # Re-insert as most recently used
+            self.entries[key] = entry
+            return entry
+
+    def get(self, key, ttl, fetch):
+        '''Get a cached value, or fetch & cache it for ttl seconds.'''
+
+        entry = self._get(key)
+
+        if not entry:
+            with self._locks[hash(key) % self.LOCKS]:
+                # May have been fetched while we waited
+                entry = self._get(key)
+
+                if not entry:
+                    self.misses += 1
+
+                    entry = (time() + ttl, fetch())
+                    self.entries[key] = entry
+
+                    while len(self.entries) > self.MAX_ENTRIES:
+                        self.entries.popitem(last=False)
+
+                    return entry[1]
+
+        self.hits += 1
+        return entry[1]
+
+
+stats_cache = StatsCache()
+
+# Buckets per cached chunk of closed buckets
+CHUNK_BUCKETS = 60
+
+# Closed chunks only change if late stats arrive, the open tail changes every tick
+CLOSED_TTL = 3600
+OPEN_TTL = 5
+
+# Stats for a bucket keep arriving until the first tick after it closes has been
+# flushed by the ingest buffer. Where the stat interval isn't known (ie groups) assume
+# this, so slower devices don't get their last stats cut off from the cached chunks.
+LATE_STAT_INTERVAL = 60
+
+
+def get_cached_stats(
+    cache_key, filters, type_, keys=None, details=None,
+    since=None, to=None, interval=None, max_points=None, stat_interval=None
+):
+    '''
+    As ..stats.get_stats, but cached per object (cache_key). The range is split into
+    chunks of CHUNK_BUCKETS buckets aligned to the epoch, so polls over a sliding
+    range share their closed chunks & only the open trailing buckets are refetched.
+    Chunks are only cached as closed once late stats (within the objects
+    stat_interval & the ingest buffer age) can no longer land in them.
+    '''
+
+    now = int(time())
+    to = min(to or now, now)
+    since = since or to - DEFAULT_RANGE
+
+    interval = get_interval(since, to, interval=interval, max_points=max_points)
+    max_points = get_max_points(max_points)
+
+    query_key = (
+        cache_key, type_,
+        tuple(sorted(keys or [])), tuple(details or []),
+        interval
+    )
+
+    def make_fetch(chunk_since, chunk_to):
+        return lambda: get_stats(
+            filters, type_, keys=keys, details=details,
+            since=chunk_since, to=chunk_to, interval=interval
+        )
+
+    chunk_size = interval * CHUNK_BUCKETS
+    open_since = now - now % interval
+    closed_before = now - (
+        interval + (stat_interval or LATE_STAT_INTERVAL) + StatBuffer.MAX_AGE
+    )
+
+    chunk_since = since - since % chunk_size
+    chunks = []
+
+    while chunk_since < to:
+        chunk_to = chunk_since + chunk_size
+
+        # Whole chunk is in the past & settled
+        if chunk_to <= closed_before:
+            chunks.append(stats_cache.get(
+                query_key + (chunk_since, chunk_to),
+                CLOSED_TTL, make_fetch(chunk_since, chunk_to)
+            ))
+
+        # Whole chunk is in the past, but late stats may still arrive
+        elif chunk_to <= open_since:
+            chunks.append(stats_cache.get(
+                query_key + (chunk_since, chunk_to),
+                OPEN_TTL, make_fetch(chunk_since, chunk_to)
+            ))
+
+        # Closed part of the chunk holding the open bucket, then the open bucket
+        else:
+            if open_since > chunk_since:
+                chunks.append(stats_cache.get(
+                    query_key + (chunk_since, open_since),
+                    OPEN_TTL, make_fetch(chunk_since, open_since)
+                ))
+
+            chunks.append(stats_cache.get(
+                query_key + (open_since, None),
+                OPEN_TTL, make_fetch(open_since, open_since + interval)
+            ))
+            break
+
+        chunk_since = chunk_to
+
+    # Merge the chunks, trimming to the buckets overlapping the range asked for
+    since_ms = (since - since % interval) * 1000
+    to_ms = to * 1000
+
+    stats = {}
+
+    for chunk in chunks:
+        for key, key_stats in chunk.iteritems():
+            merged_stats = stats.setdefault(key, {})
+
+            for detail, points in key_stats.iteritems():
+                merged_stats.setdefault(detail, []).extend(
+                    point for point in points
+                    if since_ms <= point[0] <= to_ms
+                )
+
+    for key_stats in stats.itervalues():
+        for detail, points in key_stats.iteritems():
+            key_stats[detail] = downsample(points, max_points)
+
+    return stats
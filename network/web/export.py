@@ -0,0 +1,127 @@
+# oxy.io Network
+# File: network/web/export.py
+# Desc: streaming NDJSON/CSV exports of stored stats
+
+import csv
+import json
+from cStringIO import StringIO
+from itertools import chain
+
+from flask import Response, jsonify, request, stream_with_context
+
+from ..stats import ROLLUP_RESOLUTIONS, iter_stats_documents
+from .request import get_export_request_kwargs
+
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+# Document fields that aren't detail columns
+META_FIELDS = (
+    'object_module', 'object_type', 'object_id', 'group_ids',
+    'datetime', 'type', 'key'
+)
+
+# Exported columns ahead of the details
+EXPORT_FIELDS = ('datetime', 'object_id', 'key')
+
+# Rows buffered into each chunk sent to the client
+CHUNK_ROWS = 500
+
+
+def _iter_chunks(lines):
+    chunk = []
+
+    for line in lines:
+        chunk.append(line)
+
+        if len(chunk) >= CHUNK_ROWS:
+            yield ''.join(chunk)
+            chunk = []
+
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _iter_ndjson(documents, details):
+    for document in documents:
+        if details:
+            row = {field: document.get(field) for field in EXPORT_FIELDS + details}
+        else:
+            row = {
+                field: value
+                for field, value in document.iteritems()
+                if field in EXPORT_FIELDS or field not in META_FIELDS
+            }
+
+        yield '{0}\n'.format(json.dumps(row))
+
+
+def _iter_csv(documents, details):
+    # Without requested details the columns come from the first document, every
+    # document of a type/resolution has the same ones.
+    if not details:
+        first = next(documents, None)
+        if first is None:
+            return
+
+        details = sorted(field for field in first if field not in META_FIELDS)
+        documents = chain((first,), documents)
+
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+
+    fields = EXPORT_FIELDS + tuple(details)
+    writer.writerow(fields)
+
+    for document in documents:
+        writer.writerow([
+            unicode(document.get(field, '')).encode('utf-8')
+            for field in fields
+        ])
+
+        yield buffer.getvalue()
+        buffer.truncate(0)
+
+
+def make_export_response(filters, name):
+    '''
+    Stream the stats matching filters (& the request arguments) as NDJSON or CSV.
+    Documents are scrolled from ES & written out in chunks, so memory use stays
+    constant whatever the range.
+    '''
+
+    kwargs = get_export_request_kwargs()
+
+    if not kwargs['type_']:
+        return jsonify(error='No stat type'), 400
+
+    resolutions = [resolution for resolution, _ in ROLLUP_RESOLUTIONS]
+    if kwargs['resolution'] and kwargs['resolution'] not in resolutions:
+        return jsonify(error='Invalid resolution'), 400
+
+    format_ = request.args.get('format', 'ndjson')
+    if format_ not in EXPORT_FORMATS:
+        return jsonify(error='Invalid format'), 400
+
+    details = request.args.get('details')
+    details = tuple(bit for bit in details.split(',') if bit) if details else ()
+
+    documents = iter_stats_documents(filters, **kwargs)
+
+    if format_ == 'csv':
+        lines = _iter_csv(documents, details)
+    else:
+        lines = _iter_ndjson(documents, details)
+
+    filename = '{0}-{1}.{2}'.format(name, kwargs['type_'], format_)
+
+    return Response(
+        stream_with_context(_iter_chunks(lines)),
+        mimetype=EXPORT_FORMATS[format_],
+        headers={
+            'Content-Disposition': 'attachment; filename={0}'.format(filename)
+        }
+    )
@@ -0,0 +1,45 @@
+# oxy.io Network
+# File: network/web/request.py
+# Desc: request helpers for the network views
+
+from flask import request
+
+
+def _get_list_arg(name):
+    value = request.args.get(name)
+
+    if value:
+        return [bit for bit in value.split(',') if bit]
+
+
+def _get_int_arg(name):
+    try:
+        return int(request.args[name])
+    except (KeyError, ValueError):
+        pass
+
+
+def get_stat_request_kwargs():
+    '''Get ..stats.get_stats kwargs from the request arguments.'''
+
+    return {
+        'type_': request.args.get('type'),
+        'keys': _get_list_arg('keys'),
+        'details': _get_list_arg('details'),
+        'since': _get_int_arg('since'),
+        'to': _get_int_arg('to'),
+        'interval': request.args.get('interval'),
+        'max_points': _get_int_arg('max_points')
+    }
+
+
+def get_export_request_kwargs():
+    '''Get ..stats.iter_stats_documents kwargs from the request arguments.'''
+
+    return {
+        'type_': request.args.get('type'),
+        'keys': _get_list_arg('keys'),
+        'since': _get_int_arg('since'),
+        'to': _get_int_arg('to'),
+        'resolution': request.args.get('resolution')
+    }
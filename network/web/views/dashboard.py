@@ -1,10 +1,79 @@
-from flask import render_template, g
+from flask import jsonify, render_template, request, g
 
-from oxyio.web.user import login_required
+from oxyio.web.user import login_required, has_object_permission
+
+from ...leaderboard import (
+    LEADERBOARD_METRICS, MAX_COUNT,
+    get_leaderboards, get_leaderboard_count
+)
+from ...models.device import Device
+from ..cache import stats_cache
+
+
+def _get_leaderboards():
+    try:
+        count = int(request.args.get('count', 0))
+    except ValueError:
+        count = None
+
+    count = get_leaderboard_count(count)
+
+    # Fetch the longest leaderboards, so there are still count entries once any
+    # devices the user can't view are filtered out.
+    leaderboards = get_leaderboards(MAX_COUNT)
+
+    device_ids = set(
+        device_id
+        for leaderboard in leaderboards.itervalues()
+        for device_id, _ in leaderboard
+    )
+
+    devices = {}
+    if device_ids:
+        devices = {
+            device.id: device
+            for device in Device.query.filter(Device.id.in_(device_ids))
+            if has_object_permission(device, 'view')
+        }
+
+    # Skip any devices deleted since their last score, or not viewable
+    return {
+        metric: [
+            (devices[device_id], score)
+            for device_id, score in leaderboard
+            if device_id in devices
+        ][:count]
+        for metric, leaderboard in leaderboards.iteritems()
+    }
 
 
 @login_required
 def dashboard():
     g.module = 'network'
     g.module_color = 'purple'
-    return render_template('network_dashboard.html')
+    return render_template(
+        'network_dashboard.html',
+        metrics=LEADERBOARD_METRICS,
+        leaderboards=_get_leaderboards()
+    )
+
+
+@login_required
+def api_get_leaderboards():
+    return jsonify(leaderboards={
+        metric: [
+            {
+                'device_id': device.id,
+                'name': device.name,
+                'view_url': device.view_url,
+                'score': score
+            }
+            for device, score in leaderboard
+        ]
+        for metric, leaderboard in _get_leaderboards().iteritems()
+    })
+
+
+@login_required
+def api_get_stats_cache():
+    return jsonify(**stats_cache.info)
@@ -4,19 +4,42 @@
 
 from flask import jsonify, request
 
-from oxyio.stats import get_object_stats, get_object_stat_keys
-from oxyio.web.request import get_stat_request_kwargs
+from ...stats import get_object_filters, get_object_stat_keys
+from ..cache import get_cached_stats
+from ..export import make_export_response
+from ..request import get_stat_request_kwargs
+from .fleet import start_fleet_execute
 
 
 def api_get_device_stats(device):
-    return jsonify(stats=get_object_stats(
-        device,
-        **get_stat_request_kwargs()
+    kwargs = get_stat_request_kwargs()
+
+    if not kwargs['type_']:
+        return jsonify(error='No stat type'), 400
+
+    return jsonify(stats=get_cached_stats(
+        (device.NAME, device.id),
+        get_object_filters(device),
+        stat_interval=device.stat_interval,
+        **kwargs
     ))
 
 
 def api_get_device_stat_keys(device):
-    return jsonify(keys=get_object_stat_keys(
-        device,
-        type_=request.args.get('type')
-    ))
+    type_ = request.args.get('type')
+
+    if not type_:
+        return jsonify(error='No stat type'), 400
+
+    return jsonify(keys=get_object_stat_keys(device, type_))
+
+
+def api_export_device_stats(device):
+    return make_export_response(
+        get_object_filters(device),
+        'device-{0}'.format(device.id)
+    )
+
+
+def api_execute_device(device):
+    return start_fleet_execute(device_ids=[device.id])
@@ -0,0 +1,50 @@
+# oxy.io Network
+# File: network/web/views/fleet.py
+# Desc: fleet command execution views
+
+from flask import jsonify
+
+from oxyio.app import task_app
+from oxyio.web.request import get_request_data
+from oxyio.web.websockets import make_websocket_request
+
+
+def _get_int(data, name):
+    try:
+        return int(data[name])
+    except (KeyError, TypeError, ValueError):
+        pass
+
+
+def start_fleet_execute(**kwargs):
+    '''
+    Start a network/fleet_execute task for the commands in the request, returning
+    the task ID & a websocket request key to stream its results.
+    '''
+
+    data = get_request_data()
+
+    commands = data.get('commands')
+    if isinstance(commands, basestring):
+        commands = [commands]
+
+    if (
+        not commands
+        or not all(isinstance(command, basestring) for command in commands)
+    ):
+        return jsonify(error='No commands'), 400
+
+    task_id = task_app.helpers.start_task(
+        'network/fleet_execute',
+        commands=commands,
+        sudo=data.get('sudo') in (True, 'on'),
+        concurrency=_get_int(data, 'concurrency'),
+        timeout=_get_int(data, 'timeout'),
+        **kwargs
+    )
+
+    return jsonify(
+        task_id=task_id,
+        request_key=make_websocket_request('core/task_subscribe', task_id)
+    )
+
@@ -3,24 +3,62 @@
 # Desc: group views
 
 from flask import jsonify
-from elasticquery import Query
 
-from oxyio.stats import get_stats
-from oxyio.web.request import get_stat_request_kwargs
+from oxyio.web.user import has_object_permission
 
+from ..cache import get_cached_stats
+from ..export import make_export_response
+from ..request import get_stat_request_kwargs
+from .fleet import start_fleet_execute
 
-def api_get_group_stats(group):
-    device_ids = [device.id for device in group.devices]
 
-    queries = [
-        Query.term('object_module', 'network'),
-        Query.term('object_type', 'device'),
-        Query.terms('object_id', device_ids)
+def _get_group_filters(group):
+    # Device stat documents are tagged with their groups at ingest, so there's no
+    # need to load the groups devices.
+    return [
+        {'term': {'object_module': 'network'}},
+        {'term': {'object_type': 'device'}},
+        {'term': {'group_ids': group.id}}
     ]
 
-    stats = get_stats(
-        queries=queries,
-        **get_stat_request_kwargs()
-    )
+
+def api_get_group_stats(group):
+    kwargs = get_stat_request_kwargs()
+
+    if not kwargs['type_']:
+        return jsonify(error='No stat type'), 400
+
+    stats = get_cached_stats((group.NAME, group.id), _get_group_filters(group), **kwargs)
 
     return jsonify(stats=stats)
+
+
+def api_export_group_stats(group):
+    return make_export_response(
+        _get_group_filters(group),
+        'group-{0}'.format(group.id)
+    )
+
+
+def api_execute_group(group):
+    # Edit on the group isn't enough, commands run on (and can change) every device
+    device_ids = []
+    denied_ids = []
+
+    for device in group.devices:
+        if has_object_permission(device, 'edit'):
+            device_ids.append(device.id)
+        else:
+            denied_ids.append(device.id)
+
+    if denied_ids:
+        return jsonify(
+            error='No edit permission on every group device',
+            device_ids=denied_ids
+        ), 403
+
+    if not device_ids:
+        return jsonify(error='No devices in group'), 400
+
+    # Run on the devices checked, not the group as it is when the task starts
+    return start_fleet_execute(device_ids=device_ids)
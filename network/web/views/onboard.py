@@ -0,0 +1,148 @@
+# oxy.io Network
+# File: network/web/views/onboard.py
+# Desc: bulk device onboarding views
+
+import csv
+import json
+from cStringIO import StringIO
+
+from flask import jsonify, request
+
+from oxyio.app import db, task_app
+from oxyio.web.request import get_request_data
+from oxyio.web.user import login_required, has_global_objects_permission
+from oxyio.web.websockets import make_websocket_request
+
+from ...models.device import Device
+
+
+MAX_DEVICES = 1000
+
+# field -> (type, default), None default = required
+DEVICE_FIELDS = {
+    'name': (unicode, None),
+    'ssh_host': (str, None),
+    'ssh_user': (str, None),
+    'ssh_port': (int, 22),
+    'ssh_sudo': (bool, True),
+    'location': (unicode, ''),
+    'stat_interval': (int, 10),
+    'stat_mode': (str, 'Batch')
+}
+
+TRUE_VALUES = (True, 'true', 'yes', 'on', '1')
+
+
+def _get_device_definitions():
+    # CSV uploads/bodies (with a header row), or a JSON list of objects
+    upload = request.files.get('file')
+
+    if upload:
+        data = upload.read()
+    elif request.mimetype == 'text/csv':
+        data = request.get_data()
+    else:
+        devices = get_request_data().get('devices')
+
+        # Form posts send the list JSON encoded
+        if isinstance(devices, basestring):
+            devices = json.loads(devices)
+
+        return devices
+
+    return list(csv.DictReader(StringIO(data)))
+
+
+def _make_device(definition):
+    values = {}
+
+    for field, (type_, default) in DEVICE_FIELDS.iteritems():
+        value = definition.get(field)
+
+        if value in (None, ''):
+            if default is None:
+                raise ValueError('Missing {0}'.format(field))
+
+            value = default
+
+        elif type_ is bool:
+            value = value in TRUE_VALUES
+
+        else:
+            try:
+                value = type_(value)
+            except (TypeError, ValueError):
+                raise ValueError('Invalid {0}'.format(field))
+
+        values[field] = value
+
+    device = Device()
+
+    # Generic fields, which the add view sets before check_apply_edit
+    for field in ('name', 'location'):
+        setattr(device, field, values.pop(field))
+
+    # The same validation as adding a single device
+    device.apply_edit(values)
+
+    return device
+
+
+@login_required
+def api_bulk_add_devices():
+    '''
+    Add many devices (a CSV or JSON list, with the device add form fields & an
+    optional password) in one transaction, then connect & bootstrap them with one
+    network/device_bulk_connect task.
+    '''
+
+    # As the device add view, which this replaces many of
+    if not has_global_objects_permission('network', 'device', 'add'):
+        return jsonify(error='No permission to add devices'), 403
+
+    try:
+        definitions = _get_device_definitions()
+    except (ValueError, csv.Error) as e:
+        return jsonify(error='Invalid devices: {0}'.format(e)), 400
+
+    if not definitions or not isinstance(definitions, list):
+        return jsonify(error='No devices'), 400
+
+    if len(definitions) > MAX_DEVICES:
+        return jsonify(error='Too many devices (max {0})'.format(MAX_DEVICES)), 400
+
+    devices = []
+    passwords = []
+    errors = []
+
+    for i, definition in enumerate(definitions):
+        try:
+            if not isinstance(definition, dict):
+                raise ValueError('Not an object')
+
+            devices.append(_make_device(definition))
+            passwords.append(definition.get('password') or None)
+
+        except (ValueError, Device.EditRequestError) as e:
+            errors.append({'index': i, 'error': str(e)})
+
+    # All or nothing
+    if errors:
+        return jsonify(error='Invalid devices', errors=errors), 400
+
+    db.session.add_all(devices)
+    db.session.commit()
+
+    task_id = task_app.helpers.start_task(
+        'network/device_bulk_connect',
+        devices=[
+            (device.id, password)
+            for device, password in zip(devices, passwords)
+        ]
+    )
+
+    return jsonify(
+        device_ids=[device.id for device in devices],
+        task_id=task_id,
+        request_key=make_websocket_request('core/task_subscribe', task_id)
+    )
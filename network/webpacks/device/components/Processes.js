@@ -0,0 +1,86 @@
+// oxy.io Network
+// File: network/webpacks/device/components/Processes.js
+// Desc: the device top processes component
+
+import _ from 'lodash';
+import React, { Component } from 'react';
+
+
+class ProcessTable extends Component {
+    render() {
+        const rows = _.map(this.props.processes, (process) => {
+            return (
+                <tr key={process.pid}>
+                    <td>{process.pid}</td>
+                    <td>{process.name}</td>
+                    <td>{process.cpu.toFixed(1)}%</td>
+                    <td>{process.memory.toFixed(1)}%</td>
+                    <td>{Math.round(process.rss / 1024)}MB</td>
+                </tr>
+            );
+        });
+
+        return (
+            <div>
+                <h3 className='top'>{this.props.title}</h3>
+
+                <table>
+                    <thead><tr>
+                        <th>PID</th>
+                        <th>Name</th>
+                        <th>CPU</th>
+                        <th>Memory</th>
+                        <th>RSS</th>
+                    </tr></thead>
+                    <tbody>{rows}</tbody>
+                </table>
+            </div>
+        );
+    }
+}
+
+
+export default class Processes extends Component {
+    constructor(props) {
+        super(props)
+
+        this.state = {
+            cpu: [],
+            memory: []
+        };
+    }
+
+    // Samples arrive as {cpu: [process], memory: [process]}, the top processes by each
+    handleEvent(msg) {
+        const { data, event } = JSON.parse(msg.data);
+
+        if (event === 'processes') {
+            this.setState({
+                cpu: data.cpu,
+                memory: data.memory
+            });
+        }
+    }
+
+    componentDidMount() {
+        const ws = new WebSocket(
+            'ws://' + window.location.host + '/websocket?key=' + this.props.requestKey
+        );
+
+        ws.addEventListener('message', this.handleEvent.bind(this));
+    }
+
+    render() {
+        return (
+            <div className='block base'>
+                <div className='block half'>
+                    <ProcessTable title='Top CPU' processes={this.state.cpu} />
+                </div>
+
+                <div className='block half'>
+                    <ProcessTable title='Top Memory' processes={this.state.memory} />
+                </div>
+            </div>
+        );
+    }
+};
@@ -57,16 +57,15 @@ export default class Status extends Component {
         };
     }
 
+    // Stats arrive as {key: {detail: value}} per stat type
+
     parseNetworkStats(stats) {
         let transmitBytes = 0;
         let receiveBytes = 0;
 
-        _.each(stats, (stat) => {
-            if (stat.detail == 'receive_bytes')
-                receiveBytes += stat.value;
-
-            if (stat.detail == 'transmit_bytes')
-                transmitBytes += stat.value;
+        _.each(stats, (details) => {
+            receiveBytes += details.receive_bytes;
+            transmitBytes += details.transmit_bytes;
         });
 
         this.setState({
@@ -76,11 +75,8 @@ export default class Status extends Component {
     }
 
     parseCpuStats(stats) {
-        const totalPercent = _.reduce(stats, (memo, stat) => {
-            if (stat.key == 'cpu')
-                memo += stat.value;
-
-            return memo;
+        const totalPercent = _.reduce(stats.cpu, (memo, value) => {
+            return memo + value;
         }, 0);
 
         this.setState({
@@ -89,21 +85,11 @@ export default class Status extends Component {
     }
 
     parseMemoryStats(stats) {
-        const data = {
+        const data = _.defaults({}, stats.memory, {
             total: 0,
             free: 0,
             cached: 0,
             buffers: 0
-        }
-
-        _.each(stats, (stat) => {
-            if (stat.key != 'memory')
-                return;
-
-            _.each(_.keys(data), (key) => {
-                if (stat.detail === key)
-                    data[key] = stat.value;
-            });
         });
 
         const used = data.total - data.free - data.cached - data.buffers;
@@ -115,16 +101,7 @@ export default class Status extends Component {
     }
 
     parseDiskStats(stats) {
-        const diskData = {};
-
-        _.each(stats, (stat) => {
-            if (!diskData[stat.key])
-                diskData[stat.key] = {};
-
-            diskData[stat.key][stat.detail] = stat.value;
-        });
-
-        const disks = _.reduce(diskData, (memo, data, name) => {
+        const disks = _.reduce(stats, (memo, data, name) => {
             const total = data.available + data.used;
             const percentage = data.used / total * 100;
 
@@ -7,11 +7,12 @@ import ReactDOM from 'react-dom';
 
 import 'device/style.less';
 import Status from 'device/components/Status';
+import Processes from 'device/components/Processes';
 
 // Get DOM bits
 const $device = document.querySelector('#device');
 const $statusTab = $device.querySelector('[data-tab=status]');
-const $factsTab = $device.querySelector('[data-tab=facts]');
+const $processesTab = $device.querySelector('[data-tab=processes]');
 
 
 // Render the Reacts!
@@ -27,7 +28,14 @@ window.addEventListener('load', () => {
 });
 
 
-// TODO: remove this addTabLoader crap!
-$factsTab.addTabLoader(function() {
-    console.log('LOAD DE FACTS');
+// Only subscribe (which starts the devices process sampler) once the tab is opened
+$processesTab.addTabLoader(function() {
+    const requestKey = $processesTab.getAttribute('data-websocket-key');
+
+    ReactDOM.render(
+        <Processes
+            requestKey={requestKey}
+        />,
+        $processesTab
+    );
 });
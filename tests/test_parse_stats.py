@@ -0,0 +1,165 @@
+# oxy.io Network
+# File: tests/test_parse_stats.py
+# Desc: correctness & pytest-benchmark timings of the stat parsers, against recorded
+#       command output (including 128 CPU & 64 NIC hosts)
+
+from os import path
+
+import pytest
+
+from network.tasks.util.parse_stats import (
+    CPU_COLUMNS, DISK_COLUMNS, DISK_IO_COLUMNS, NETWORK_IO_COLUMNS,
+    parse_cpu_stats, calculate_cpu_percentages, calculate_differences,
+    parse_memory_stats, parse_disk_stats, parse_disk_io_stats, parse_network_io_stats
+)
+
+
+FIXTURES_DIR = path.join(path.dirname(__file__), 'fixtures')
+
+
+def get_fixture(name):
+    with open(path.join(FIXTURES_DIR, name)) as f:
+        return f.read()
+
+
+# CPU (/proc/stat)
+#
+
+@pytest.mark.parametrize(('name', 'cpus'), (
+    ('proc_stat.txt', 4),
+    ('proc_stat_128cpu.txt', 128)
+))
+def test_parse_cpu_stats(benchmark, name, cpus):
+    stats = get_fixture(name)
+
+    cpu_stats = benchmark(parse_cpu_stats, stats)
+
+    # Every core plus the total
+    assert len(cpu_stats) == cpus + 1
+    assert 'cpu{0}'.format(cpus - 1) in cpu_stats
+
+    for details in cpu_stats.itervalues():
+        assert sorted(details) == sorted(CPU_COLUMNS)
+
+    assert cpu_stats['cpu']['user'] == sum(
+        details['user']
+        for key, details in cpu_stats.iteritems()
+        if key != 'cpu'
+    )
+
+
+def test_calculate_cpu_percentages(benchmark):
+    previous = parse_cpu_stats(get_fixture('proc_stat_128cpu.txt'))
+
+    current = {
+        key: {
+            column: value + (90 if column == 'idle' else 10 if column == 'user' else 0)
+            for column, value in details.iteritems()
+        }
+        for key, details in previous.iteritems()
+    }
+
+    percentages = benchmark(calculate_cpu_percentages, previous, current)
+
+    assert len(percentages) == 129
+    assert percentages['cpu127']['user'] == 10
+    assert 'idle' not in percentages['cpu127']
+
+
+# Memory (/proc/meminfo)
+#
+
+def test_parse_memory_stats(benchmark):
+    stats = get_fixture('meminfo.txt')
+
+    memory_stats = benchmark(parse_memory_stats, stats)
+
+    assert memory_stats == {
+        'memory': {
+            'total': 16318508,
+            'free': 1873296,
+            'buffers': 701284,
+            'cached': 8112044
+        },
+        'swap': {
+            'total': 8388604,
+            'free': 8310012,
+            'cached': 5120
+        }
+    }
+
+
+# Disk (df)
+#
+
+def test_parse_disk_stats(benchmark):
+    stats = get_fixture('df.txt')
+
+    disk_stats = benchmark(parse_disk_stats, stats)
+
+    # /dev & /run mounts and none filesystems are skipped
+    assert sorted(disk_stats) == [
+        '/', '/boot', '/srv/data files', '/sys/fs/cgroup', '/var/lib/docker'
+    ]
+    assert disk_stats['/'] == dict(zip(DISK_COLUMNS, (61796348, 31187524, 27446196)))
+
+
+# Disk IO (/proc/diskstats)
+#
+
+def test_parse_disk_io_stats(benchmark):
+    stats = get_fixture('diskstats.txt')
+
+    disk_io_stats = benchmark(parse_disk_io_stats, stats)
+
+    # Loop & ram devices are skipped
+    assert not any(
+        key.startswith('loop') or key.startswith('ram')
+        for key in disk_io_stats
+    )
+    assert len(disk_io_stats) == 12
+
+    # Newer kernels discard fields are ignored
+    assert sorted(disk_io_stats['nvme0n1']) == sorted(DISK_IO_COLUMNS)
+
+
+# Network IO (/proc/net/dev)
+#
+
+@pytest.mark.parametrize(('name', 'nics'), (
+    ('net_dev.txt', 4),
+    ('net_dev_64nic.txt', 64)
+))
+def test_parse_network_io_stats(benchmark, name, nics):
+    stats = get_fixture(name)
+
+    network_io_stats = benchmark(parse_network_io_stats, stats)
+
+    assert len(network_io_stats) == nics
+
+    for details in network_io_stats.itervalues():
+        assert sorted(details) == sorted(NETWORK_IO_COLUMNS)
+
+
+def test_parse_network_io_stats_counter_into_colon():
+    network_io_stats = parse_network_io_stats(get_fixture('net_dev.txt'))
+
+    assert network_io_stats['eth1']['receive_bytes'] == 920406288959
+    assert network_io_stats['eth1']['transmit_bytes'] == 166926023221
+
+
+def test_calculate_differences(benchmark):
+    previous = parse_network_io_stats(get_fixture('net_dev_64nic.txt'))
+
+    current = {
+        key: {
+            detail: value + 100
+            for detail, value in details.iteritems()
+        }
+        for key, details in previous.iteritems()
+    }
+
+    differences = benchmark(calculate_differences, previous, current)
+
+    assert len(differences) == 64
+    assert differences['bond0']['receive_bytes'] == 100